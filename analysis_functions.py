@@ -2,8 +2,20 @@ import pandas as pd
 import numpy as np
 import sys
 import os
+import warnings
 
 from lookup_classes import Operant_event_strings as oes
+from lookup_classes import known_events
+
+def csv_files(directory):
+    '''absolute paths of every csv under directory, like assemble_names but without changing 
+    the working directory, so relative paths used elsewhere keep working'''
+    out_names = []
+    for root, dirs, files in os.walk(os.path.abspath(directory)):
+        dirs.sort()
+        out_names += [os.path.join(root, f) for f in sorted(files) if 
+                      f.endswith('.csv') if not f.startswith('.')]
+    return out_names
 
 def assemble_names(directory):
     '''return a list of paths to files to parse'''
@@ -21,115 +33,197 @@ def assemble_names(directory):
         out_names += out
     return out_names
 
-def latency_by_round(df, event_1, event_2,  
-                    new_col_name = None, 
-                    include_missing_data_as_nan = False, 
-                    selected_by = None,
-                    get_rounds_from = 'first'
-                ):
-    '''get the latency from event_1 to event_2. event_1 should be whatever occurred first. If 
-    there is a length mismatch of 1 this will assume the latency of the last index of event_1
-    is missing. For example, a pellet was not retrieved before the end of the experiment. This
-    event will be trimmed unless include_missing_data_as_nan is set to True. 
+def encode_events(events):
+    '''convert a column of raw event strings to a pandas Categorical. Categories are the
+    events registered on Operant_event_strings followed by any unknown events found in 
+    this session, so nothing is dropped and every comparison against an event string 
+    becomes a small int comparison on the category codes.'''
+    if isinstance(events.dtype, pd.CategoricalDtype):
+        return events
+    registry = known_events()
+    registered = set(registry)
+    #missing events (eg. a blank cell in a chunk) stay missing rather than becoming a category
+    unknown = [e for e in pd.unique(events) if e not in registered and not pd.isna(e)]
+    return pd.Categorical(events, categories = registry + sorted(unknown, key = str))
+
+def concat_sessions(frames, **kwargs):
+    '''concatenate several sessions while keeping Event categorical. Each session can carry 
+    its own unknown events, so the categories are unioned before concatenating.'''
+    frames = list(frames)
+    if all(isinstance(f.Event.dtype, pd.CategoricalDtype) for f in frames):
+        union = pd.api.types.union_categoricals([f.Event for f in frames]).categories
+        frames = [f.assign(Event = f.Event.cat.set_categories(union)) for f in frames]
+    return pd.concat(frames, **kwargs)
+
+class SessionIndex:
+    '''per-event lookup table for one session, built in a single pass over the DataFrame 
+    returned by analyze.prep_for_analysis. 
     
-    This function assumes each round can have at most 1 latency to calculate.
+    For each event string it keeps the Time and Round arrays of that event sorted by time,
+    so counting an event or pulling out its slice is a dict lookup instead of a boolean 
+    scan of the whole Event column. Build it once per session and pass it to the helpers
+    below in place of the DataFrame.'''
     
-    round number indicates round in which event_1 happened
+    def __init__(self, df):
+        self.data = df
+        
+        order = np.argsort(df.Time.to_numpy(), kind = 'stable')
+        time = df.Time.to_numpy()[order]
+        rnd = df.Round.to_numpy()[order]
+        labels = df.index.to_numpy()[order]
+        
+        #group on the category codes when Event is encoded, so we never materialize strings
+        if isinstance(df.Event.dtype, pd.CategoricalDtype):
+            keys = df.Event.cat.codes.to_numpy()[order]
+            names = df.Event.cat.categories
+        else:
+            keys = df.Event.to_numpy()[order]
+            names = None
+        
+        self.events = {}
+        for key, positions in pd.Series(keys).groupby(keys, sort = False).indices.items():
+            event = names[key] if names is not None else key
+            self.events[event] = (time[positions], rnd[positions], labels[positions])
+        
+        self.round_numbers = np.unique(rnd)
+        self.max_round = df.Round.max()
     
-    include_missing_data_as_nan = True --> final value of returned array will be np.nan selected_by 
-                                           should be a list of events to select your desired rounds by. 
-                                           For example, if we want to choose lever press latency we 
-                                           should only select rounds on which a lever was pressed, 
-                                           and will pass that as [<lever_press_event_string>]. 
+    def count(self, event):
+        return len(self.times(event))
     
-    in contrast, if we want to get the pellet retrieval we should ignore this, as retrievals
-    can happen on different rounds than when the pellet was dispensed. (Pellet dispensed on round 2,
-    retrieved on round 5, for example)
+    def times(self, event):
+        return self.events[event][0] if event in self.events else np.array([], dtype = float)
+    
+    def rounds(self, event):
+        return self.events[event][1] if event in self.events else np.array([], dtype = int)
+    
+    def rounds_with(self, event):
+        '''unique rounds on which event occurred'''
+        return np.unique(self.rounds(event))
+    
+    def slice(self, event, rounds = None):
+        '''rows of the session for event, optionally limited to the given rounds. Same 
+        columns and index labels as df.loc[df.Event == event]'''
+        if event in self.events:
+            time, rnd, labels = self.events[event]
+        else:
+            time, rnd, labels = [np.array([], dtype = t) for t in (float, int, int)]
+        
+        if rounds is not None:
+            keep = np.isin(rnd, rounds)
+            time, rnd, labels = time[keep], rnd[keep], labels[keep]
+        
+        return pd.DataFrame({'Round':rnd, 'Event':event, 'Time':time}, index = labels)
+
+def session_index(data):
+    '''return data as a SessionIndex, building one if we were handed a DataFrame'''
+    return data if isinstance(data, SessionIndex) else SessionIndex(data)
+
+def next_event_latency(data, event_1, event_2,
+                       new_col_name = None,
+                       same_round = False,
+                       selected_by = None,
+                       get_rounds_from = 'first',
+                       include_missing_data_as_nan = True
+                    ):
+    '''pair every event_1 with the next event_2 at or after it and return the latency between them.
+    
+    This is a handful of vectorized operations (a sorted array search over the event_2 times) no
+    matter how long the session is, and it does not care whether the two events were recorded
+    the same number of times. event_1s with no following event_2 get a latency of NaN.
+    
+    same_round : bool. only pair event_1 with an event_2 in the same round. Use this for events
+                 that should reset every round, like beam breaks after a door opening. Leave it 
+                 False for events that can cross rounds, like pellet retrieval.
+    
+    selected_by : event_string. limit the rounds analyzed to rounds on which this event occurred. 
+                  For example, lever press latency should use "selected_by = <lever press string>"
+                  so rounds without a press are ignored. dont use for events whose latencies 
+                  cross a change in round!
     
     get_rounds_from : str, 'first' or 'second'. Which event to get the round numbers from. For example,
                       if a pellet is dispensed in round 1 and retrieved in round 4, we can use 'first'
                       to assign the round in the output to 1, or use 'second' to assign the round in
-                      the output to 4.
-                      
-    selected_by : event_string. If you want to limit the rounds analyzed to rounds on which an event occurred. For example, 
-                  if we want to limit lever_press analysis to only rounds on which a lever was pressed, ignoring
-                  rounds on which a lever wasnt pressed, we can use "selected_by = <door_2 leverpress string>"  
-
-    '''
+                      the output to 4. With 'second', event_1s that were never followed by event_2
+                      have no round and are dropped, and when several event_1s come before the same 
+                      event_2 only the nearest one is paired with it.
+    
+    include_missing_data_as_nan : bool. keep the unmatched event_1 rows (with NaN latency). 
+    
+    returns a DataFrame with the Round, Event and Time of the event the rounds were taken from, 
+    plus a column with the latency.'''
     
     if get_rounds_from not in ('first', 'second'):
         raise TypeError('get_rounds_from tells this function which event to use when noting the round corresponding to latency. Must be "first" or "second"')
     
-    if not new_col_name:
-        new_col = f'latency_from_|{event_1}|_to_|{event_2}|'
-    else:
-        new_col = new_col_name
+    new_col = new_col_name if new_col_name else f'latency_from_|{event_1}|_to_|{event_2}|'
     
-    '''new_df_blank = np.asarray([[r, np.nan] for r in df.Round.unique()])
-    new_df = pd.DataFrame(data = new_df_blank, columns = ['Round',new_col_name])'''
+    index = session_index(data)
+    rounds = index.rounds_with(selected_by) if selected_by else None
+    sli_1 = index.slice(event_1, rounds)
+    sli_2 = index.slice(event_2, rounds)
     
-    if selected_by:
-        #choose the rounds where selected_by occurs
-        rounds = df.loc[df.Event == selected_by, 'Round'].unique()
-        
-        #only get rounds where selected_by has occured. dont use for events
-        #whose latencies cross a change in round!
-        sli_1 = df.loc[(df.Event == event_1)&(df.Round.isin(rounds))].copy()
-        sli_2 = df.loc[(df.Event == event_2)&(df.Round.isin(rounds))].copy()
+    t_1 = sli_1.Time.to_numpy()
+    t_2 = sli_2.Time.to_numpy()
+    
+    #position of the first event_2 at or after each event_1
+    nxt = np.searchsorted(t_2, t_1, side = 'left')
+    matched = nxt < len(t_2)
+    nxt = np.where(matched, nxt, 0)
+    
+    if same_round and len(t_2):
+        matched &= sli_2.Round.to_numpy()[nxt] == sli_1.Round.to_numpy()
+    
+    latency = np.full(len(t_1), np.nan)
+    if len(t_2):
+        latency[matched] = t_2[nxt[matched]] - t_1[matched]
+    
+    if get_rounds_from == 'first':
+        out = sli_1.assign(**{new_col:latency})
+        return out if include_missing_data_as_nan else out.loc[matched]
     else:
-        sli_1 = df.loc[(df.Event == event_1)].copy()
-        sli_2 = df.loc[(df.Event == event_2)].copy()
+        #several event_1s can precede the same event_2, only the nearest one (the last, as t_1 is
+        #sorted) is kept so every event_2 appears once and the rounds stay unique
+        keep = np.flatnonzero(matched)
+        keep = keep[np.append(np.diff(nxt[keep]) != 0, True)] if len(keep) else keep
+        out = sli_2.iloc[nxt[keep]]
+        return out.assign(**{new_col:latency[keep]})
+
+def latencies_by_round(data, pairs, **defaults):
+    '''compute many event latencies from one session in a single call.
     
-        
-    if len(sli_1) == len(sli_2):
-        #length of slices match, so we can simply take the difference
-        
-        #which event should be the one from which the round labels are taken?
-        #for example, for pellet latencies, we usually want the round on which the 
-        #pellet was dispensed. But it could be useful to instead use the round
-        #on which the pellet was retrieved. 
-        if get_rounds_from == 'first':
-            sli_1.loc[:, new_col] = sli_2.Time.values - sli_1.Time.values
-            return new_col, sli_1
-        else:
-            #use the slice for the second event to get rounds
-            sli_2.loc[:,new_col] = sli_2.Time.values - sli_1.Time.values
-            return new_col, sli_2
-        
-    elif len(sli_1) == len(sli_2) + 1:
-        if get_rounds_from == 'first':
-            sli_1.loc[:, new_col] = np.nan
-            lat = sli_2.Time.values - sli_1.Time.values[:-1]
-            sli_1.iloc[:-1].loc[:, new_col] = lat
-            return new_col, sli_1
+    pairs : dict of {new_col_name : (event_1, event_2)} or {new_col_name : {'event_1':..., 
+            'event_2':..., any other next_event_latency keyword}}. 
+    defaults : keywords passed to next_event_latency for every pair that doesnt set its own.
+    
+    The session is indexed once and shared by every pair. returns {new_col_name : DataFrame}'''
+    index = session_index(data)
+    out = {}
+    for new_col, pair in pairs.items():
+        kwargs = dict(defaults)
+        if isinstance(pair, dict):
+            kwargs.update(pair)
         else:
-            sli_2.loc[:,new_col] = np.nan
-            lat = sli_2.Time.values - sli_1.Time.values[:-1]
-            sli_2.iloc[:-1].loc[:, new_col] = lat
-            return new_col, sli_2
-    else:
-        raise IndexError(f'these two events, "{event_1}" and "{event_2}" have an unequal number of recordings (diff > 1).\n e1: {len(sli_1)} e2: {len(sli_2)}')
+            kwargs['event_1'], kwargs['event_2'] = pair
+        out[new_col] = next_event_latency(index, new_col_name = new_col, **kwargs)
+    return out
 
-def latency_by_round_expect_unequal(df, event_1, event_2,  
+def latency_by_round(df, event_1, event_2,  
                     new_col_name = None, 
                     include_missing_data_as_nan = False, 
                     selected_by = None,
                     get_rounds_from = 'first'
                 ):
-    '''get the latency from event_1 to event_2. event_1 should be whatever occurred first. If 
-    there is a length mismatch of 1 this will assume the latency of the last index of event_1
-    is missing. For example, a pellet was not retrieved before the end of the experiment. This
-    event will be trimmed unless include_missing_data_as_nan is set to True. 
-    
-    This function assumes each round can have at most 1 latency to calculate.
+    '''get the latency from event_1 to event_2. event_1 should be whatever occurred first. Each 
+    event_1 is paired with the next event_2 (see next_event_latency), so the two events dont need
+    to be recorded the same number of times. An event_1 that was never followed by event_2, for 
+    example a pellet that was not retrieved before the end of the experiment, will be trimmed 
+    unless include_missing_data_as_nan is set to True, in which case its latency is np.nan.
     
     round number indicates round in which event_1 happened
     
-    include_missing_data_as_nan = True --> final value of returned array will be np.nan selected_by 
-                                           should be a list of events to select your desired rounds by. 
-                                           For example, if we want to choose lever press latency we 
-                                           should only select rounds on which a lever was pressed, 
-                                           and will pass that as [<lever_press_event_string>]. 
+    if we want to choose lever press latency we should only select rounds on which a lever was 
+    pressed, and will pass that as selected_by = <lever_press_event_string>. 
     
     in contrast, if we want to get the pellet retrieval we should ignore this, as retrievals
     can happen on different rounds than when the pellet was dispensed. (Pellet dispensed on round 2,
@@ -144,84 +238,33 @@ def latency_by_round_expect_unequal(df, event_1, event_2,
                   if we want to limit lever_press analysis to only rounds on which a lever was pressed, ignoring
                   rounds on which a lever wasnt pressed, we can use "selected_by = <door_2 leverpress string>"  
 
-
-    might be able to replace all this with pd.merge functionality:
-    https://pandas.pydata.org/pandas-docs/version/0.20/merging.html
-
     '''
+    new_col = new_col_name if new_col_name else f'latency_from_|{event_1}|_to_|{event_2}|'
     
-    if get_rounds_from not in ('first', 'second'):
-        raise TypeError('get_rounds_from tells this function which event to use when noting the round corresponding to latency. Must be "first" or "second"')
-    
-    if not new_col_name:
-        new_col = f'latency_from_|{event_1}|_to_|{event_2}|'
-    else:
-        new_col = new_col_name
-    
-    '''new_df_blank = np.asarray([[r, np.nan] for r in df.Round.unique()])
-    new_df = pd.DataFrame(data = new_df_blank, columns = ['Round',new_col_name])'''
-    
-    if selected_by:
-        #choose the rounds where selected_by occurs
-        rounds = df.loc[df.Event == selected_by, 'Round'].unique()
-        
-        #only get rounds where selected_by has occured. dont use for events
-        #whose latencies cross a change in round!
-        sli_1 = df.loc[(df.Event == event_1)&(df.Round.isin(rounds))].copy()
-        sli_2 = df.loc[(df.Event == event_2)&(df.Round.isin(rounds))].copy()
-    else:
-        sli_1 = df.loc[(df.Event == event_1)].copy()
-        sli_2 = df.loc[(df.Event == event_2)].copy()
-    
-        
-    if len(sli_1) == len(sli_2):
-        #length of slices match, so we can simply take the difference
-        
-        #which event should be the one from which the round labels are taken?
-        #for example, for pellet latencies, we usually want the round on which the 
-        #pellet was dispensed. But it could be useful to instead use the round
-        #on which the pellet was retrieved. 
-        if get_rounds_from == 'first':
-            sli_1.loc[:, new_col] = sli_2.Time.values - sli_1.Time.values
-            return new_col, sli_1
-        else:
-            #use the slice for the second event to get rounds
-            sli_2.loc[:,new_col] = sli_2.Time.values - sli_1.Time.values
-            return new_col, sli_2
-        
-    elif len(sli_1) == len(sli_2) + 1:
-        if get_rounds_from == 'first':
-            sli_1.loc[:, new_col] = np.nan
-            lat = sli_2.Time.values - sli_1.Time.values[:-1]
-            sli_1.iloc[:-1].loc[:, new_col] = lat
-            return new_col, sli_1
-        else:
-            sli_2.loc[:,new_col] = np.nan
-            lat = sli_2.Time.values - sli_1.Time.values[:-1]
-            sli_2.iloc[:-1].loc[:, new_col] = lat
-            return new_col, sli_2
-    else:
-        
-        sli_1.rename(columns = {"Time":event_1}, inplace = True)
-        sli_2.rename(columns = {"Time":event_2}, inplace = True)
-        print(sli_1.head())
-        new_df = pd.merge(sli_1, sli_2, on = 'Round')
-        print(new_df.head())
-        new_df[new_col] = new_df[event_2] - new_df[event_1]
+    return new_col, next_event_latency(df, event_1, event_2, 
+                                       new_col_name = new_col, 
+                                       selected_by = selected_by, 
+                                       get_rounds_from = get_rounds_from, 
+                                       include_missing_data_as_nan = include_missing_data_as_nan)
 
-        return new_col, new_df
-
-def latency_by_round_v2(df, event_1, event_2,  
+def latency_by_round_expect_unequal(df, event_1, event_2,  
                     new_col_name = None, 
                     include_missing_data_as_nan = False, 
                     selected_by = None,
                     get_rounds_from = 'first'
                 ):
-
-    '''want to try and rewrite using pandas merge function'''
-
-
-
+    '''same as latency_by_round, but event_1 is only paired with an event_2 from the same round. 
+    Use this when the two events are expected to be recorded an unequal number of times and 
+    each round should be judged on its own, eg. door openings that were not followed by a beam break.
+    '''
+    new_col = new_col_name if new_col_name else f'latency_from_|{event_1}|_to_|{event_2}|'
+    
+    return new_col, next_event_latency(df, event_1, event_2, 
+                                       new_col_name = new_col, 
+                                       same_round = True,
+                                       selected_by = selected_by, 
+                                       get_rounds_from = get_rounds_from, 
+                                       include_missing_data_as_nan = include_missing_data_as_nan)
 
 def latency_to_beam_break(df):
 
@@ -229,58 +272,245 @@ def latency_to_beam_break(df):
     #some rounds will have NaN if the animal didnt break the beam after the door
     #opened on that round
 
-    d1_col_name, round_df_d1 = latency_by_round_expect_unequal(df, 
-                                              event_1 = oes.door1_open_start, 
-                                              event_2 = oes.beam_break_1,
-                                              selected_by = oes.beam_break_1, 
-                                              new_col_name = 'latency_beam_break_door1')
-
-    d2_col_name, round_df_d2 = latency_by_round_expect_unequal(df, 
-                                              event_1 = oes.door2_open_start, 
-                                              event_2 = oes.beam_break_2,
-                                              selected_by = oes.beam_break_2, 
-                                              new_col_name = 'latency_beam_break_door2')
-    
-    return {d1_col_name:round_df_d1, d2_col_name:round_df_d2}
+    return latencies_by_round(df, 
+                              {'latency_beam_break_door1':{'event_1':oes.door1_open_start, 
+                                                           'event_2':oes.beam_break_1, 
+                                                           'selected_by':oes.beam_break_1},
+                               'latency_beam_break_door2':{'event_1':oes.door2_open_start, 
+                                                           'event_2':oes.beam_break_2, 
+                                                           'selected_by':oes.beam_break_2}},
+                              same_round = True, 
+                              include_missing_data_as_nan = False)
 
 def count_event(df, event):
+    if isinstance(df, SessionIndex):
+        return df.count(event)
     return len(df.loc[df.Event == event])
 
+def contingent_events(df, pairs, by_round = False):
+    '''count, for every pair of events, the rounds on which event_2 occurred after event_1 
+    within the same round. eg # of rounds in which beam break occured after lever press. 
+    All pairs are computed from a single groupby over Round and Event.
+    
+    pairs    : dict of {name : (event_1, event_2)}, or a list of (event_1, event_2) tuples which 
+               will be named "event_1|event_2"
+    by_round : also return the per round ordering, a table with a Round column and one column 
+               per pair that is 1 if event_2 followed event_1 on that round, 0 if event_1 happened
+               without a following event_2, and NaN if event_1 did not happen.
+    
+    returns a DataFrame indexed by pair name with columns event_1, event_2, rounds_with_event_1 
+    and rounds_with_event_2_after_event_1 (and the by round table if by_round is True)'''
+    df = df.data if isinstance(df, SessionIndex) else df
+    if not isinstance(pairs, dict):
+        pairs = {f'{e1}|{e2}':(e1, e2) for e1, e2 in pairs}
+    
+    events = list(dict.fromkeys(e for pair in pairs.values() for e in pair))
+    rounds = np.unique(df.Round.to_numpy())
+    
+    #first and last time of every event of interest on every round
+    sub = df.loc[df.Event.isin(events), ['Round', 'Event', 'Time']]
+    times = sub.groupby(['Round', 'Event'], observed = True).Time.agg(['min', 'max'])
+    first = times['min'].unstack().reindex(index = rounds, columns = events)
+    last = times['max'].unstack().reindex(index = rounds, columns = events)
+    
+    summary = []
+    ordering = {}
+    for name, (event_1, event_2) in pairs.items():
+        has_e1 = first[event_1].notna()
+        e2_after = last[event_2] > first[event_1]
+        summary += [[name, event_1, event_2, int(has_e1.sum()), int(e2_after.sum())]]
+        ordering[name] = e2_after.astype(float).where(has_e1)
+    
+    summary = pd.DataFrame(summary, columns = ['pair', 'event_1', 'event_2', 
+                                               'rounds_with_event_1', 
+                                               'rounds_with_event_2_after_event_1']).set_index('pair')
+    if by_round:
+        return summary, round_table(rounds, ordering)
+    return summary
+
 def count_contingent_events(df, event_1, event_2):
-    '''counttimes event_2 occured after event_1 within the same round. 
-    eg # of rounds in which beam break occured after lever press'''
+    '''count rounds on which event_2 occured after event_1 within the same round. 
+    eg # of rounds in which beam break occured after lever press. 
+    
+    returns {event_1 : rounds with event_1, event_2 : rounds where event_2 followed event_1}'''
+    counts = contingent_events(df, {'pair':(event_1, event_2)}).loc['pair']
+    return {event_1:int(counts.rounds_with_event_1), event_2:int(counts.rounds_with_event_2_after_event_1)}
+
+class RoundAccumulator:
+    '''per round metrics built up incrementally, for sessions that are streamed in rather than 
+    loaded whole. Feed it the events of complete rounds in order with update(), as many rounds 
+    at a time as you have, and read the by round table with table() whenever you like.
     
-    rounds = df.loc[df.Event == event_1, 'Round'].unique()
-    e1_count = 0
-    e2_count = 0
+    counts    : dict of {column name : event}, the number of times event happened each round
+    latencies : dict of {column name : {'event_1':..., 'event_2':..., 'same_round':bool, 
+                'selected_by':event}} with the same pairing rules as next_event_latency: every 
+                event_1 is paired with the next event_2, which may come in a later round unless 
+                same_round is set. The latency is reported on the round of the first event_1 of
+                that round.
     
-    for r in rounds:
-        e1_count += len(df.loc[(df.Event == event_1) & ('Round'==r)])
-        e2_count += len(df.loc[(df.Event == event_2) & ('Round'==r)])
+    Only one value per round and column, and the event_1s still waiting for their event_2, 
+    are kept, so memory does not grow with the number of events in the session.'''
+    
+    def __init__(self, counts = None, latencies = None):
+        self.counts = dict(counts) if counts else {}
+        self.latencies = {}
+        for col, pair in (latencies or {}).items():
+            self.latencies[col] = {'same_round':False, 'selected_by':None, **pair}
         
-    return {event_1:e1_count, event_2:e2_count}
-
+        #every event we look at, its position here is its code in update()
+        events = list(self.counts.values())
+        for pair in self.latencies.values():
+            events += [pair['event_1'], pair['event_2'], pair['selected_by']]
+        self._events = [e for e in dict.fromkeys(events) if e is not None]
+        self._codes = {e:code for code, e in enumerate(self._events)}
+        
+        #{round : None}, every round seen so far in order
+        self._rounds = {}
+        #{column : {round : value}}
+        self._values = {col:{} for col in self.columns()}
+        #first event_1 of each round still waiting for an event_2: {column : [(round, time), ...]}
+        self._pending = {col:[] for col in self.latencies}
+    
+    def columns(self):
+        return list(self.counts) + list(self.latencies)
+    
+    def update(self, rounds_df):
+        '''add the events of one or more complete rounds. A round cant be split over two calls.'''
+        if not len(rounds_df):
+            return
+        rnd = rounds_df.Round.to_numpy().astype(int)
+        new_round = np.r_[True, rnd[1:] != rnd[:-1]]
+        round_numbers = rnd[new_round]
+        n_rounds = len(round_numbers)
+        
+        #events are taken round by round and in time order within a round
+        run = np.cumsum(new_round) - 1
+        time = rounds_df.Time.to_numpy(dtype = float)
+        order = np.lexsort((time, run))
+        run, time = run[order], time[order]
+        codes = pd.Categorical(rounds_df.Event, categories = self._events).codes[order]
+        
+        self._rounds.update(dict.fromkeys(round_numbers.tolist()))
+        for col, event in self.counts.items():
+            counts = np.bincount(run[codes == self._codes[event]], minlength = n_rounds)
+            self._values[col].update(zip(round_numbers.tolist(), counts.tolist()))
+        
+        for col, pair in self.latencies.items():
+            is_1 = codes == self._codes[pair['event_1']]
+            is_2 = codes == self._codes[pair['event_2']]
+            if pair['selected_by'] is not None:
+                selected = np.zeros(n_rounds, dtype = bool)
+                selected[run[codes == self._codes[pair['selected_by']]]] = True
+                is_1 &= selected[run]
+                is_2 &= selected[run]
+            pos_1 = np.flatnonzero(is_1)
+            pos_2 = np.flatnonzero(is_2)
+            values = self._values[col]
+            
+            pending = self._pending[col]
+            if pending and len(pos_2):
+                for e1_round, e1_time in pending:
+                    values[e1_round] = time[pos_2[0]] - e1_time
+                pending.clear()
+            
+            #only the first event_1 of a round reports a latency
+            pos_1 = pos_1[np.r_[True, run[pos_1][1:] != run[pos_1][:-1]]] if len(pos_1) else pos_1
+            nxt = np.searchsorted(pos_2, pos_1)
+            matched = nxt < len(pos_2)
+            nxt = pos_2[np.where(matched, nxt, 0)] if len(pos_2) else nxt
+            if pair['same_round'] and len(pos_2):
+                matched &= run[nxt] == run[pos_1]
+            
+            values.update(zip(round_numbers[run[pos_1[matched]]].tolist(),
+                              (time[nxt[matched]] - time[pos_1[matched]]).tolist()))
+            if not pair['same_round']:
+                waiting = pos_1[~matched]
+                pending += zip(round_numbers[run[waiting]].tolist(), time[waiting].tolist())
+    
+    def table(self):
+        '''by round table of everything seen so far, NaN for latencies still pending'''
+        rounds = pd.Index(sorted(self._rounds), name = 'Round')
+        table = pd.DataFrame({col:pd.Series(self._values[col], dtype = int if col in self.counts else float)
+                              for col in self.columns()}, index = rounds)
+        return table.reset_index()
+
+def standard_round_accumulator():
+    '''RoundAccumulator for the metrics we usually want to keep an eye on: lever presses,
+    lever press latencies, pellet retrieval and beam breaks'''
+    counts = {'door_1_lever_presses':oes.door1_leverpress_prod,
+              'door_2_lever_presses':oes.door2_leverpress_prod,
+              'food_lever_presses':oes.food_leverpress_prod,
+              'pellets_dispensed':oes.disp,
+              'pellets_retrieved':oes.retr,
+              'door_1_beam_breaks':oes.beam_break_1,
+              'door_2_beam_breaks':oes.beam_break_2}
+    latencies = {'door_1_lever_press_latency':{'event_1':oes.lever_out, 
+                                               'event_2':oes.door1_leverpress_prod, 
+                                               'same_round':True},
+                 'door_2_lever_press_latency':{'event_1':oes.lever_out, 
+                                               'event_2':oes.door2_leverpress_prod, 
+                                               'same_round':True},
+                 'food_lever_press_latency':{'event_1':oes.lever_out, 
+                                             'event_2':oes.food_leverpress_prod, 
+                                             'same_round':True},
+                 'pellet_latency':{'event_1':oes.disp, 
+                                   'event_2':oes.retr},
+                 'latency_beam_break_door1':{'event_1':oes.door1_open_start, 
+                                             'event_2':oes.beam_break_1, 
+                                             'same_round':True},
+                 'latency_beam_break_door2':{'event_1':oes.door2_open_start, 
+                                             'event_2':oes.beam_break_2, 
+                                             'same_round':True}}
+    return RoundAccumulator(counts, latencies)
+
+def _check_unique_rounds(rounds, new_col_name):
+    if rounds.duplicated().any():
+        raise IndexError(f'impossible to match {new_col_name} on Round, as there are duplicate rounds. \n{rounds.value_counts()}')
 
 def roundwise_join(df1, df2, new_col_name):
+    _check_unique_rounds(df2.Round, new_col_name)
     new_df = df1.copy()
-    new_df[new_col_name] = np.nan
-    if len(df2.Round.unique()) != len(df2):
-        raise IndexError(f'impossible to match on Round, as there are duplicate rounds. \n{df2.Round.value_counts()}')
-    for index, row in df2.iterrows():
-        r = int(row.Round)
-        val = row[new_col_name]
-        new_df.loc[new_df.Round == r, new_col_name] = val
-    
+    new_df[new_col_name] = new_df.Round.map(df2.set_index('Round')[new_col_name]).astype(float)
     return new_df
 
-def remove_duplicate_events(df, event_str):
-    df_out = df.copy()
-    for r in df.Round.unique():
-        if len(df.loc[(df.Round ==r)&(df.Event == event_str)]) > 1:
-            indices = df.index[(df.Round ==r)&(df.Event == event_str)].tolist()
-            
-            df_out.drop(axis = 0, index = indices[1:], inplace = True)
-            
+def round_table(rounds, columns):
+    '''build the by round output of a session in one go.
+    
+    rounds  : every round of the session, eg. SessionIndex.round_numbers
+    columns : dict of {column name : per round result}. A result is either a DataFrame with a 
+              Round column and a column of the same name (what the latency helpers return) or 
+              a Series indexed by Round.
+    
+    returns a DataFrame with a Round column and one column per result, NaN on rounds a result 
+    has no value for. Each result may only have one value per round.'''
+    values = []
+    for name, result in columns.items():
+        if isinstance(result, pd.DataFrame):
+            result = result.set_index('Round')[name]
+        _check_unique_rounds(result.index, name)
+        values += [result.rename(name).astype(float)]
+    
+    index = pd.Index(rounds, name = 'Round')
+    if values:
+        table = pd.concat(values, axis = 1).reindex(index)
+    else:
+        table = pd.DataFrame(index = index)
+    return table.reset_index()
+
+def remove_duplicate_events(df, event_str, return_counts = False):
+    '''keep only the first occurrence of an event within each round. 
+    
+    event_str     : a single event string or a list of them
+    return_counts : also return {event string : number of duplicates removed}, for QC
+    '''
+    events = [event_str] if isinstance(event_str, str) else list(event_str)
+    
+    duplicates = df.Event.isin(events) & df.duplicated(['Round', 'Event'])
+    df_out = df.loc[~duplicates]
+    
+    if return_counts:
+        removed = pd.Series(df.Event.to_numpy()[duplicates.to_numpy()]).value_counts()
+        return df_out, {e:int(removed.get(e, 0)) for e in events}
     return df_out
 
 def create_header_string(header_dict):
@@ -290,24 +520,121 @@ def create_header_string(header_dict):
             heading_string+=f'{key}:{header_dict[key]}|'
         return heading_string
 
+class HeaderWarning(UserWarning):
+    """Part of a file header could not be parsed. Carries the file, the offending value and why."""
+    def __init__(self, fname, value, reason):
+        self.fname = fname
+        self.value = value
+        self.reason = reason
+        super().__init__(f'{reason} in header of {fname}: {value!r}')
+
+#header keys that are always numbers
+numeric_header_keys = ('vole', 'day')
+
+class HeaderNumber:
+    """a number read from a header that remembers the text it was read from. It compares and 
+    does arithmetic like the number, but str() and f-strings give back the original text, so 
+    ids with leading zeros (vole:03558) are written back out unchanged."""
+    def __new__(cls, text):
+        number = super().__new__(cls, text)
+        number.text = text
+        return number
+    
+    def __str__(self):
+        return self.text
+    
+    def __format__(self, spec):
+        return self.text if not spec else super().__format__(spec)
+    
+    def __reduce__(self):
+        return (type(self), (self.text,))
+
+class HeaderInt(HeaderNumber, int):
+    pass
+
+class HeaderFloat(HeaderNumber, float):
+    pass
+
+def decode_header_value(key, value, fname = None):
+    '''turn the text of a header value into a python value. nan -> np.nan, True/False -> bool, 
+    and the numeric_header_keys to int or float (whichever the text was). Numbers are returned 
+    as HeaderInt/HeaderFloat, which keep their text, so writing the header back out with 
+    create_header_string gives exactly what was read.'''
+    if value == 'nan':
+        return np.nan
+    if value in ('True', 'False'):
+        return value == 'True'
+    if key in numeric_header_keys:
+        try:
+            return HeaderInt(value)
+        except ValueError:
+            pass
+        try:
+            return HeaderFloat(value)
+        except ValueError:
+            warnings.warn(HeaderWarning(fname, f'{key}:{value}', f'{key} is not a number'), stacklevel = 3)
+    return value
+
+def parse_header_line(line, fname = None):
+    '''parse a "key:value|key:value|" header line into a dict of decoded values'''
+    header_dict = {}
+    for val in line.rstrip('\r\n').split('|'):
+        if not val.strip():
+            continue
+        unpacked = val.split(':')
+        if len(unpacked) == 2:
+            header_dict[unpacked[0]] = decode_header_value(unpacked[0], unpacked[1], fname)
+        else:
+            reason = 'missing ":"' if len(unpacked) == 1 else 'more than one ":"'
+            warnings.warn(HeaderWarning(fname, val, reason), stacklevel = 2)
+    return header_dict
+
 def get_header(fname, skiplines = 1):
     """header looks like:
     
     vole:3558.0|day:4.0|experiment:Door_shape|user:protter|output_directory:/home/pi/Documents/operant_experiment|partner:door_1|novel_num:000|completed_rounds:nan|done:False|expected_date:10_2_20|experiment_status:nan|num_rounds:20.0|rounds_completed:nan|run_time:nan|script:Door_shape|
+    
+    values are decoded by decode_header_value, problems are reported as HeaderWarnings.
     """
     with open(fname) as f:
         for _ in range(skiplines):
             f.readline()
-        header_vals = f.readline().split('|')
-        header_dict = {}
-        for val in header_vals:
-            unpacked = val.split(':')
-            if len(unpacked) == 2:
-                header_dict[unpacked[0]] = unpacked[1]
-            if len(unpacked) > 2:
-                print(f'hmm, theres something weird going on in the header. Heres the value:{val}')
-                
-    return header_dict
+        return parse_header_line(f.readline(), fname)
+
+def read_headed_csv(fname, skiplines = 1, **read_csv_kwargs):
+    '''read the header and the csv body of a file with a single open. skiplines lines are 
+    skipped, the next line is parsed as the header and the same file handle is passed on to
+    pd.read_csv for the rest. returns (header_dict, DataFrame)'''
+    with open(fname, newline = '') as f:
+        for _ in range(skiplines):
+            f.readline()
+        head = parse_header_line(f.readline(), fname)
+        df = pd.read_csv(f, **read_csv_kwargs)
+    return head, df
+
+def write_with_header(fname, df, header_string):
+    '''write header_string as the first line of fname and df as csv below it, in a single pass.
+    The file is written next to its destination and renamed into place, so a batch that gets
+    interrupted never leaves a half written output behind.'''
+    tmp_fname = fname + '.tmp'
+    try:
+        with open(tmp_fname, 'w', newline = '') as f:
+            f.write(header_string.rstrip('\r\n') + '\n')
+            df.to_csv(f)
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+        raise
+
+def write_session_outputs(head, round_df = None, by_round_fname = None, 
+                          summary_df = None, summary_fname = None):
+    '''write the by round and/or summary outputs of a session, each with the session header on top'''
+    header_string = create_header_string(head)
+    if round_df is not None:
+        write_with_header(by_round_fname, round_df, header_string)
+    if summary_df is not None:
+        write_with_header(summary_fname, summary_df, header_string)
 
 def line_prepender(filename, line):
     with open(filename, 'r+') as f:
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import inspect
+import traceback
+
+import analysis_functions as af
+import analysis_script_lookup as asl
+
+def file_hash(filepath, chunk_size = 1 << 20):
+    '''sha256 of a file's contents, read in chunks so big sessions dont have to fit in memory'''
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+#modules in this folder count as part of an analysis script (analysis_functions, metric_specs...)
+package_dir = os.path.dirname(os.path.abspath(__file__))
+
+def local_dependencies(module):
+    '''source files of module and of every module from its own folder or this package that it 
+    uses, directly or through other such modules. installed packages (pandas etc.) are left out'''
+    roots = {package_dir, os.path.dirname(os.path.abspath(module.__file__))}
+    files = set()
+    stack = [module]
+    while stack:
+        mod = stack.pop()
+        path = getattr(mod, '__file__', None)
+        if not path or not path.endswith('.py'):
+            continue
+        path = os.path.abspath(path)
+        if os.path.dirname(path) not in roots or path in files:
+            continue
+        files.add(path)
+        for value in vars(mod).values():
+            #catches "import x" as well as "from x import y"
+            dep = value if inspect.ismodule(value) else inspect.getmodule(value) if (
+                inspect.isclass(value) or inspect.isfunction(value)) else None
+            if dep is not None:
+                stack.append(dep)
+    return sorted(files)
+
+def source_version(*modules):
+    '''hash of the source of modules and all their local_dependencies'''
+    files = sorted(set(f for module in modules for f in local_dependencies(module)))
+    sha = hashlib.sha256()
+    for f in files:
+        sha.update(f'{os.path.basename(f)}:{file_hash(f)}\n'.encode())
+    return sha.hexdigest()
+
+def module_version(module):
+    '''version string for an analysis module: the hash of its source and of the local modules 
+    it uses (analysis_functions, metric_specs, lookup_classes...), plus its analysis_version if
+    it sets one. Any edit to the script or a helper it relies on changes the version, which 
+    marks every session it analyzed as stale.'''
+    version = source_version(module)
+    explicit = getattr(module, 'analysis_version', None)
+    return version if explicit is None else f'{version}|{explicit}'
+
+class AnalysisManifest:
+    '''persistent record of which raw session files have already been analyzed.
+
+    for every file we keep its size, mtime, content hash, experiment and the version of
+    the analysis module that produced its outputs. A file only needs to be analyzed
+    again if it is new, its content changed, or its analysis script changed. size and
+    mtime are checked first so unchanged files are never re-hashed.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._versions = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        '''write the manifest to a temporary file and move it into place, so an
+        interrupted run never leaves a half written manifest behind.'''
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent = 1)
+        os.replace(tmp_path, self.path)
+
+    def version_for(self, experiment, custom_script = None):
+        '''version of the module that would analyze this experiment. looked up once per
+        experiment and remembered.'''
+        key = custom_script if custom_script else experiment
+        if key not in self._versions:
+            if custom_script:
+                self._versions[key] = module_version(asl.load_custom_script(custom_script))
+            else:
+                self._versions[key] = module_version(asl.script_lookup(experiment))
+        return self._versions[key]
+
+    def _stat(self, filepath):
+        st = os.stat(filepath)
+        return st.st_size, st.st_mtime
+
+    def needs_analysis(self, filepath, outputs = (), custom_script = None):
+        '''True if filepath is new, changed, or was analyzed by an older version of its
+        analysis script. outputs is an optional list of files the analysis writes; if
+        any of them is missing the session is analyzed again.'''
+        entry = self.entries.get(filepath)
+        if entry is None:
+            return True
+
+        if not all(os.path.exists(out) for out in outputs):
+            return True
+
+        size, mtime = self._stat(filepath)
+        if size != entry['size'] or mtime != entry['mtime']:
+            #file was touched. only a content change counts
+            if file_hash(filepath) != entry['hash']:
+                return True
+            entry['size'] = size
+            entry['mtime'] = mtime
+
+        try:
+            version = self.version_for(entry['experiment'], custom_script)
+        except Exception:
+            traceback.print_exc()
+            print(f'couldnt get analysis module version for {filepath}')
+            return True
+        return version != entry['version']
+
+    def record(self, filepath, custom_script = None):
+        '''note that filepath was just analyzed successfully'''
+        size, mtime = self._stat(filepath)
+        experiment = af.get_header(filepath).get('experiment')
+        self.entries[filepath] = {'size':size,
+                                  'mtime':mtime,
+                                  'hash':file_hash(filepath),
+                                  'experiment':experiment,
+                                  'version':self.version_for(experiment, custom_script)}
+
+    def forget(self, filepath):
+        self.entries.pop(filepath, None)
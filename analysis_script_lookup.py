@@ -1,66 +1,127 @@
+'''which analysis module analyzes which experiment.
+
+Experiments are looked up, in order, in
+    - modules added with register() (a module name, the path to a .py file, or a module)
+    - the "operant_analysis.experiments" entry points of installed packages,
+      eg. in a package's pyproject.toml:
+          [project.entry-points."operant_analysis.experiments"]
+          my_experiment = "my_package.my_experiment_analysis"
+    - builtin_modules, the scripts in this package
+
+Modules are only imported the first time their experiment is looked up, then reused.'''
 import sys
 import os
 
 import traceback
 import importlib
+import importlib.util
+from importlib import metadata
+
+entry_point_group = 'operant_analysis.experiments'
+
+#experiment name (as in the session header) -> module
+builtin_modules = {'Door_test':'door_test_analysis',
+                   'Autoshape':'autoshape_analysis',
+                   'Door_shape':'door_shape_analysis',
+                   'Magazine':'magazine_analysis',
+                   'social_choice':'social_choice_analysis'}
+
+#{experiment : module name, .py path or module} added with register
+_registered = {}
+#{experiment : module}, everything imported so far
+_loaded = {}
+#{path : module}, custom scripts loaded so far
+_custom = {}
+_entry_points = None
+
+def register(experiment, module):
+    '''analyze experiment with module: a module name, the path to a .py file, or a module.
+    replaces whatever was used for experiment before.'''
+    _registered[experiment] = module
+    _loaded.pop(experiment, None)
+
+def entry_points():
+    '''{experiment : entry point} of the analysis modules installed by other packages'''
+    global _entry_points
+    if _entry_points is None:
+        try:
+            _entry_points = {ep.name:ep for ep in metadata.entry_points(group = entry_point_group)}
+        except Exception:
+            traceback.print_exc()
+            print('couldnt read analysis module entry points')
+            _entry_points = {}
+    return _entry_points
+
+def experiments():
+    '''every experiment that has an analysis module'''
+    return sorted(set(builtin_modules) | set(entry_points()) | set(_registered))
+
+def _import(source):
+    if not isinstance(source, str):
+        return source
+    elif source.endswith('.py'):
+        return load_custom_script(source)
+    return importlib.import_module(source)
 
 def script_lookup(experiment):
-    table = {'Door_test':door_test,
-             'Autoshape':autoshape,
-             'Door_shape':door_shape,
-             'Magazine':magazine}
+    '''the analysis module for experiment. raises KeyError for an unknown experiment'''
+    if experiment in _loaded:
+        return _loaded[experiment]
 
-    return table[experiment]()
+    if experiment in _registered:
+        source = _registered[experiment]
+    elif experiment in entry_points():
+        source = entry_points()[experiment]
+    elif experiment in builtin_modules:
+        source = builtin_modules[experiment]
+    else:
+        raise KeyError(f'no analysis module for experiment "{experiment}"')
 
-def magazine():
     try:
-        print('importing magazine analysis module')
-        import magazine_analysis as magazine
+        module = source.load() if isinstance(source, metadata.EntryPoint) else _import(source)
     except:
         traceback.print_exc()
-        print('couldnt import magazine analysis script')
+        print(f'couldnt import {experiment} analysis script')
         raise
-    return magazine
+    if module is None:
+        raise ImportError(f'couldnt import {experiment} analysis script')
+
+    _loaded[experiment] = module
+    return module
+
+#loaders for each built in experiment, kept for code that called them directly
+def magazine():
+    return script_lookup('Magazine')
 
 def autoshape():
-    try:
-        import autoshape_analysis as autoshape
-    except:
-        traceback.print_exc()
-        print('couldnt import Autoshape analysis script')
-        raise
-    return autoshape
+    return script_lookup('Autoshape')
 
 def door_shape():
-    try:
-        print('importing door_shape analysis module')
-        import door_shape_analysis as door_shape
-    except:
-        traceback.print_exc()
-        print('couldnt import door_shape analysis script')
-        raise
-    return door_shape
-    
+    return script_lookup('Door_shape')
+
 def door_test():
-    try:
-        import door_test_analysis as door_test
-    except:
-        traceback.print_exc()
-        print('couldnt import door_test analysis script')
-        raise
-    return door_test
+    return script_lookup('Door_test')
+
+def social_choice():
+    return script_lookup('social_choice')
 
 def load_custom_script(fpath):
     '''this will directly load a module from an fpath for using custom analysis scripts
-    outside of the RPi_Operant package.'''
+    outside of the RPi_Operant package. Each file is only loaded once.'''
+    fpath = os.path.abspath(fpath)
+    if fpath in _custom:
+        return _custom[fpath]
+
     #dynamically load a module from its filepath
     try:
-        spec = importlib.util.spec_from_file_location(fpath)
+        name = os.path.splitext(os.path.basename(fpath))[0]
+        spec = importlib.util.spec_from_file_location(name, fpath)
         module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(module)
     except:
         traceback.print_exc()
         print(f'couldnt import custom script {fpath}')
-    
+
         return None
-    return module
\ No newline at end of file
+    _custom[fpath] = module
+    return module
@@ -1,19 +1,34 @@
 import pandas as pd
+import numpy as np
 import traceback
 import sys
 import os
+import time
+import copy
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import analysis_script_lookup as asl
 import analysis_functions as af
+import analysis_manifest as am
+import longitudinal_functions as lf
+import summary_store as ss
 
-def run_analysis_script(filepath, custom_script = None, output_loc = None):
+def run_analysis_script(filepath, custom_script = None, output_loc = None, summary_store = None,
+                        cache = None):
     '''fpath of csv output from operant experiment. Can direct to a custom 
-    analysis script by passing its full path.'''
-    header = af.get_header(filepath)
+    analysis script by passing its full path.
     
-    #
-    fname_sum, fname_by_round, df = prep_for_analysis(filepath, 
-                                                      output_override_loc = output_loc)
+    summary_store : directory of a summary_store. When given the session summary is also 
+                    added there, alongside the legacy summary csv.
+    cache         : result_cache.ResultCache (or its directory). If this session was already
+                    analyzed by the same version of its script, the cached outputs are written
+                    instead of running the analysis again.'''
+    cache = _open_cache(cache)
+    header, fname_sum, fname_by_round, df = load_session(filepath, 
+                                                         output_override_loc = output_loc,
+                                                         cache = cache)
     if not custom_script:
         try:
             exp = header['experiment']
@@ -35,13 +50,36 @@ def run_analysis_script(filepath, custom_script = None, output_loc = None):
     else:
         analysis_module = asl.load_custom_script(custom_script)
 
-    analysis_module.run_analysis(data_raw = df,
-                                       head = header,
-                                       by_round_fname = fname_by_round,
-                                       summary_fname = fname_sum)
-
-def prep_for_analysis(filepath, output_override_loc = None):
+    outputs = None
+    if cache:
+        key = cache.outputs_key(filepath, analysis_module)
+        outputs = cache.get(key)
+        if outputs is not None:
+            round_df, summary_df = outputs
+            af.write_session_outputs(header, 
+                                     round_df = round_df, by_round_fname = fname_by_round,
+                                     summary_df = summary_df, summary_fname = fname_sum)
+    
+    if outputs is None:
+        outputs = analysis_module.run_analysis(data_raw = df,
+                                           head = header,
+                                           by_round_fname = fname_by_round,
+                                           summary_fname = fname_sum)
+        if cache and outputs is not None:
+            cache.put(key, outputs)
+    
+    if summary_store:
+        if outputs is not None:
+            _, summary_df = outputs
+        else:
+            #custom scripts might not hand back their tables, so read what they wrote
+            _, summary_df = lf.read_summary_csv(fname_sum)
+        ss.append_summary(summary_store, header, summary_df, fname_sum)
     
+    return header
+
+def output_names(filepath, output_override_loc = None):
+    '''names of the summary and by round files written for the raw session at filepath'''
     if output_override_loc:
         if os.path.isdir(output_override_loc):
             filepath_out = os.path.join(output_override_loc, 
@@ -54,16 +92,294 @@ def prep_for_analysis(filepath, output_override_loc = None):
             
     fname_summary = append_name_general(filepath_out, 'summary')
     fname_by_round = append_name_general(filepath_out, 'analysis_by_round')
-        
-    df = pd.read_csv(filepath, skiprows = 2)
-    df.dropna(axis = 1, inplace = True)
+    return fname_summary, fname_by_round
+
+def _open_cache(cache):
+    if isinstance(cache, str):
+        import result_cache
+        return result_cache.shared(cache)
+    return cache
+
+def load_session(filepath, output_override_loc = None, chunksize = None, cache = None):
+    '''read a raw session csv, opening it once for both the header and the events.
+    
+    chunksize : read the session this many lines at a time and encode each chunk's events 
+                before reading the next, so only one chunk of raw event strings is held at a
+                time. The returned table still holds the whole session, so memory still grows
+                with the length of the file. For memory bounded by the chunk size use 
+                iter_session_rounds or stream_round_metrics instead.
+    cache     : result_cache.ResultCache (or its directory). A session that was parsed 
+                before, and hasnt changed since, is read from the cache instead.
+    
+    returns header dict, summary output name, by round output name, event DataFrame'''
+    fname_summary, fname_by_round = output_names(filepath, output_override_loc)
+    
+    cache = _open_cache(cache)
+    if cache:
+        key = cache.events_key(filepath)
+        cached = cache.get(key)
+        if cached is not None:
+            head, df = cached
+            return head, fname_summary, fname_by_round, df
+    
+    if chunksize:
+        with open(filepath, newline = '') as f:
+            f.readline()
+            head = af.parse_header_line(f.readline(), filepath)
+            df = af.concat_sessions([chunk.assign(Event = af.encode_events(chunk.Event)) for chunk in 
+                                     pd.read_csv(f, usecols = session_columns, chunksize = chunksize)], 
+                                    ignore_index = True)
+    else:
+        head, df = af.read_headed_csv(filepath, skiplines = 1)
+        df.dropna(axis = 1, inplace = True)
+        df['Event'] = af.encode_events(df.Event)
+    
+    if cache:
+        cache.put(key, (head, df))
+    return head, fname_summary, fname_by_round, df
+
+def prep_for_analysis(filepath, output_override_loc = None, chunksize = None, cache = None):
+    '''output names and event DataFrame of a raw session, see load_session'''
+    _, fname_summary, fname_by_round, df = load_session(filepath, 
+                                                        output_override_loc = output_override_loc, 
+                                                        chunksize = chunksize,
+                                                        cache = cache)
     return fname_summary, fname_by_round, df
-       
+
+#columns of a raw session csv
+session_columns = ['Round', 'Event', 'Time']
+
+def _last_round_start(rounds):
+    '''position of the first row of the last round in a Round column, 0 if there is one round'''
+    rounds = rounds.to_numpy()
+    changes = np.flatnonzero(rounds[1:] != rounds[:-1])
+    return changes[-1] + 1 if len(changes) else 0
+
+def iter_session_chunks(filepath, chunksize = 10000):
+    '''read a raw session csv chunksize lines at a time and yield DataFrames of the rounds 
+    completed so far, each round whole and in a single DataFrame. Memory use is bounded by the 
+    chunk size rather than the length of the session.'''
+    carry = None
+    for chunk in pd.read_csv(filepath, skiprows = 2, usecols = session_columns, chunksize = chunksize):
+        if carry is not None:
+            chunk = pd.concat((carry, chunk), ignore_index = True)
+        
+        #the last round of the chunk may continue in the next one
+        start = _last_round_start(chunk.Round)
+        if start:
+            yield chunk.iloc[:start]
+        carry = chunk.iloc[start:]
+    
+    if carry is not None and len(carry):
+        yield carry
+
+def iter_session_rounds(filepath, chunksize = 10000):
+    '''like iter_session_chunks, but yield (round, DataFrame of that round's events) one round 
+    at a time'''
+    for chunk in iter_session_chunks(filepath, chunksize = chunksize):
+        for rnd, round_df in chunk.groupby('Round', sort = False):
+            yield rnd, round_df
+
+def stream_round_metrics(filepath, accumulator = None, chunksize = 10000):
+    '''compute per round metrics of a session without loading it whole. accumulator is an
+    analysis_functions.RoundAccumulator, by default the standard one. returns its by round table'''
+    accumulator = accumulator if accumulator else af.standard_round_accumulator()
+    for chunk in iter_session_chunks(filepath, chunksize = chunksize):
+        accumulator.update(chunk)
+    return accumulator.table()
+
+class SessionTail:
+    '''follow a raw session csv while the rig is still writing it, keeping per round metrics
+    up to date. Each poll() reads only the bytes added since the last one; the rounds it 
+    completes (a round is complete once the next one has started) are handed to the 
+    accumulator together, and finish() hands over the last one when the session is over.
+
+        tail = SessionTail(filepath)
+        tail.poll()
+        tail.table()   #by round metrics of the rounds completed so far
+
+    accumulator : analysis_functions.RoundAccumulator, by default the standard one'''
+
+    def __init__(self, filepath, accumulator = None):
+        self.filepath = filepath
+        #kept untouched so the tail can start over from a clean copy
+        self._template = accumulator if accumulator else af.standard_round_accumulator()
+        self._reset()
+
+    def _reset(self):
+        self.accumulator = copy.deepcopy(self._template)
+        self.head = None
+        self.offset = 0
+        self.completed_rounds = []
+        #events of the round that is still going
+        self._current = None
+
+    def poll(self):
+        '''read whatever was appended since the last poll. returns the rounds completed by it'''
+        if os.path.getsize(self.filepath) < self.offset:
+            #file was rewritten rather than appended to, start over
+            self._reset()
+
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.offset)
+            new = f.read()
+        #only whole lines, a partly written line is read again next time
+        end = new.rfind(b'\n') + 1
+        self.offset += end
+        text = new[:end].decode()
+
+        if self.head is None:
+            lines = text.split('\n', 3)
+            if len(lines) < 4:
+                #title, header and column names not all there yet
+                self.offset = 0
+                return []
+            self.head = af.parse_header_line(lines[1], self.filepath)
+            self._columns = next(csv.reader([lines[2].rstrip('\r')]))
+            missing = [col for col in session_columns if col not in self._columns]
+            if missing:
+                raise ValueError(f'{self.filepath} has no {", ".join(missing)} column')
+            text = lines[3]
+
+        if not text.strip():
+            return []
+        rows = pd.read_csv(io.StringIO(text), header = None, names = self._columns, 
+                           usecols = session_columns)
+        if self._current is not None:
+            rows = pd.concat((self._current, rows), ignore_index = True)
+        start = _last_round_start(rows.Round)
+        self._current = rows.iloc[start:]
+        return self._complete_rounds(rows.iloc[:start])
+
+    def _complete_rounds(self, rows):
+        if not len(rows):
+            return []
+        self.accumulator.update(rows)
+        rounds = rows.Round.to_numpy().astype(int)
+        completed = rounds[np.r_[True, rounds[1:] != rounds[:-1]]].tolist()
+        self.completed_rounds += completed
+        return completed
+
+    def finish(self):
+        '''the session is over: read anything left and count the last round'''
+        completed = self.poll()
+        if self._current is not None:
+            completed += self._complete_rounds(self._current)
+            self._current = None
+        return completed
+
+    def table(self):
+        '''by round table of the rounds completed so far'''
+        return self.accumulator.table()
+
+def follow_session(filepath, poll_interval = 5, idle_timeout = 600, accumulator = None):
+    '''tail a session as it is written, yielding the by round table every time rounds are
+    completed. Stops once the file hasnt grown for idle_timeout seconds, after yielding the
+    table with the last round included.'''
+    tail = SessionTail(filepath, accumulator = accumulator)
+    last_change = time.time()
+    while time.time() - last_change < idle_timeout:
+        offset = tail.offset
+        if tail.poll():
+            yield tail.table()
+        if tail.offset != offset:
+            last_change = time.time()
+        time.sleep(poll_interval)
+
+    tail.finish()
+    yield tail.table()
+
 
 
 def append_name_general(input_name, append_str, sep = '_'):
         vals = input_name.split('.')
         return vals[0] + sep + append_str + '.' + vals[1]
 
+#suffixes added by prep_for_analysis to the output files of a session
+output_suffixes = ('_summary.csv', '_analysis_by_round.csv')
+
+def raw_session_files(directory):
+    '''return every raw session csv under directory, skipping the summary and 
+    by round outputs written by a previous analysis.'''
+    return [f for f in af.csv_files(directory) if not f.endswith(output_suffixes)]
+
+def _analyze_one(filepath, custom_script = None, output_loc = None, summary_store = None, cache = None):
+    '''worker for run_analysis_batch. never raises, so one bad session cant take 
+    down the whole batch. returns a row for the results table.'''
+    start = time.perf_counter()
+    result = {'file':filepath, 'experiment':None, 'status':'ok', 'error':None}
+    try:
+        header = run_analysis_script(filepath, custom_script = custom_script, output_loc = output_loc,
+                                     summary_store = summary_store, cache = cache)
+        result['experiment'] = header.get('experiment')
+    except Exception:
+        result['status'] = 'error'
+        result['error'] = traceback.format_exc()
+        try:
+            result['experiment'] = af.get_header(filepath).get('experiment')
+        except Exception:
+            pass
+    result['seconds'] = time.perf_counter() - start
+    return result
 
+def run_analysis_batch(filepaths, n_workers = None, custom_script = None, output_loc = None,
+                       summary_store = None, cache = None):
+    '''analyze many raw session csvs at once by fanning them out over a process pool.
+    Each file is dispatched to its analysis module through analysis_script_lookup, 
+    exactly as run_analysis_script does for a single file.
+    
+    n_workers : int, number of worker processes. Defaults to the number of cores. 
+                n_workers = 1 runs everything in this process, which is handy for debugging.
+    summary_store : directory of a summary_store to add each session's summary to.
+    cache : result_cache.ResultCache (or its directory) shared by all the workers.
+    
+    returns a DataFrame with one row per file (in the order given) with columns 
+    file, experiment, status ('ok' or 'error'), error (traceback text) and seconds.'''
+    filepaths = list(filepaths)
+    n_workers = n_workers if n_workers else os.cpu_count()
+    #one handle for the whole batch, each worker process unpickles it as its own shared handle
+    cache = _open_cache(cache)
+    
+    if n_workers == 1 or len(filepaths) < 2:
+        results = [_analyze_one(f, custom_script, output_loc, summary_store, cache) for f in filepaths]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers = n_workers) as pool:
+            futures = [pool.submit(_analyze_one, f, custom_script, output_loc, summary_store, cache) 
+                       for f in filepaths]
+            for future in as_completed(futures):
+                results.append(future.result())
+        
+        order = {f:i for i, f in enumerate(filepaths)}
+        results = sorted(results, key = lambda res: order[res['file']])
+    
+    return pd.DataFrame(results, columns = ['file', 'experiment', 'status', 'error', 'seconds'])
+
+def analyze_directory(directory, n_workers = None, custom_script = None, output_loc = None,
+                      manifest_path = None, summary_store = None, cache = None):
+    '''run every raw session csv under directory through run_analysis_batch.
+    
+    manifest_path : path to an analysis_manifest json file. When given, only sessions that 
+                    are new, changed, or whose analysis script changed since the last run 
+                    are analyzed, and the manifest is updated with the ones that succeeded.'''
+    files = raw_session_files(directory)
+    
+    if manifest_path:
+        manifest = am.AnalysisManifest(manifest_path)
+        files = [f for f in files if manifest.needs_analysis(f, 
+                                                             outputs = output_names(f, output_loc), 
+                                                             custom_script = custom_script)]
+    
+    results = run_analysis_batch(files, 
+                              n_workers = n_workers, 
+                              custom_script = custom_script, 
+                              output_loc = output_loc,
+                              summary_store = summary_store,
+                              cache = cache)
+    
+    if manifest_path:
+        for f in results.loc[results.status == 'ok', 'file']:
+            manifest.record(f, custom_script = custom_script)
+        manifest.save()
     
+    return results
@@ -1,228 +1,51 @@
-import sys
-sys.path.append('/home/pi/')
-
 import analysis_functions as af
+import metric_specs as ms
 from lookup_classes import Operant_event_strings as oes
 import pandas as pd
-import numpy as np
-
-#door shape and door test should have the same calculations but they should have diff files
-def run_analysis(data_raw, head, by_round_fname, summary_fname):
-    data = af.remove_duplicate_events(data_raw, event_str = ' Levers out')
-
-    #get latency from levers out to door_2 lever presses
-    event_1 = oes.lever_out
-    event_2 = oes.door1_leverpress_prod
-    
-    col_name = 'door_1_lever_press_latency'
-    
-    
-    new_col, new_data = af.latency_by_round(data, event_1, event_2, 
-                                             new_col_name = col_name, 
-                                             selected_by = event_2)
-    
-    new_df_blank = np.asarray([[r, np.nan] for r in data.Round.unique()])
-    
-    new_df = pd.DataFrame(data = new_df_blank, columns = ['Round',new_col])
-    
-    new_df = new_df.astype({'Round':int})
-    new_df = af.roundwise_join(new_df, new_data, new_col)
-
-
-    event_1 = oes.lever_out
-    event_2 = oes.door2_leverpress_prod
-    col_name = 'door_2_lever_press_latency'
-    new_col, new_data = af.latency_by_round(data, event_1, event_2, new_col_name = col_name, selected_by = event_2)
-    round_df = af.roundwise_join(new_df, new_data, new_col)
-    
-    beam_breaks = af.latency_to_beam_break(data)
-    d1_by_round = beam_breaks['latency_beam_break_door1']
-    d2_by_round = beam_breaks['latency_beam_break_door2']
-
-    round_df = af.roundwise_join(round_df, d1_by_round, new_col_name='latency_beam_break_door1')
-    round_df = af.roundwise_join(round_df, d2_by_round, new_col_name='latency_beam_break_door2')
-
-    summary = []
-
-    total_rounds = data.Round.max()
-    summary += [['number of rounds in experiment', 'rounds', total_rounds]]
 
-########## door leverpress section #############3
+#door shape and door test should have the same calculations but they should have diff files.
+#the summary metrics are shared specs from metric_specs, each script only picks which ones it reports.
+#doors alternate, so each door's lever is out on half of the rounds
+SUMMARY_PLAN = ms.compile_plan(
+    [ms.DOOR_METRICS[name] for name in ('rounds',
+                                        'total_lever_press',
+                                        'non_press_rounds',
+                                        'prop_non_presses_by_rounds',
+                                        'door_1_lever_press_count',
+                                        'door_1_non_press_count',
+                                        'door_2_lever_press_count',
+                                        'door_2_non_press_count',
+                                        'door_1_lever_press_round_proportion',
+                                        'door_1_non_press_round_proportion',
+                                        'door_2_lever_press_round_proportion',
+                                        'door_2_non_press_round_proportion')] + ms.DOOR_SUMMARY_TAIL,
+    intermediates = ms.DOOR_INTERMEDIATES + [ms.MetricSpec('door_opportunities', 
+                                                           lambda total_rounds: total_rounds / 2)])
 
-    '''calculate the values for the days summary'''
-    #calculate number of presses
-    total_presses = len(data.loc[data.Event == oes.door1_leverpress_prod]) + len(data.loc[data.Event == oes.door2_leverpress_prod])
-    summary += [['total number of lever presses', 'total_lever_press', total_presses]]
-
-    non_presses = total_rounds - total_presses
-    summary += [['rounds without a press', 'non_press_rounds', non_presses]]
-    
-    prop_non_presses = non_presses/total_rounds
-    summary += [['proportion of rounds without a lever press', 'prop_non_presses_by_rounds', prop_non_presses]]
-
-    
-###
-
-    door_1_lever_press_count = af.count_event(data, oes.door1_leverpress_prod)
-    summary += [['number of presses for door 1', 'door_1_lever_press_count', door_1_lever_press_count]]
-    
-    door_1_non_press_count = int(total_rounds / 2) - door_1_lever_press_count
-    summary += [['opportunities for door_1 where there was no press', 
-                 'door_1_non_press_count', door_1_non_press_count]]
-
-    door_2_lever_press_count = af.count_event(data, oes.door2_leverpress_prod)
-    summary += [['number of presses for door 2', 'door_2_lever_press_count', door_2_lever_press_count]]
-    
-    door_2_non_press_count = int(total_rounds / 2) - door_2_lever_press_count
-    summary += [['opportunities for door_2 where there was no press', 
-                 'door_2_non_press_count', door_2_non_press_count]]
-
- ###   
-    door_1_lever_press_prop_of_rounds = door_1_lever_press_count / (total_rounds / 2)
-    summary += [['proportion of rounds on which door 1 was pressed', 
-                'door_1_lever_press_round_proportion', 
-                door_1_lever_press_prop_of_rounds]]
-    
-    door_1_non_press_prop_of_rounds = door_1_non_press_count / (total_rounds / 2)
-    summary += [['proportion of rounds on which door 1 was not pressed', 
-                'door_1_non_press_round_proportion', 
-                door_1_non_press_prop_of_rounds]]
-
-
-    door_2_lever_press_prop_of_rounds = door_2_lever_press_count / (total_rounds / 2)
-    summary += [['proportion of rounds on which door 2 was pressed', 
-                'door_2_lever_press_round_proportion', 
-                door_2_lever_press_prop_of_rounds]]
-    
-    door_2_non_press_prop_of_rounds = door_2_non_press_count / (total_rounds / 2)
-    summary += [['proportion of rounds on which door 2 was pressed', 
-                'door_2_non_press_round_proportion', 
-                door_2_non_press_prop_of_rounds]]
-
-###    
-
-    if total_presses > 0:
-        door_1_lever_press_prop_of_presses = door_1_lever_press_count / total_presses
-    else:
-        door_1_lever_press_prop_of_presses = np.nan
-    
-    summary += [['proportion of all presses that were for door_1', 
-                'door_1_lever_press_total_press_proportion', 
-                door_1_lever_press_prop_of_presses]]
-
-    if total_presses > 0:
-        door_2_lever_press_prop_of_presses = door_2_lever_press_count / total_presses
-    else:
-        door_2_lever_press_prop_of_presses = np.nan    
-        
-    summary += [['proportion of all presses that were for door_2', 
-                'door_2_lever_press_total_press_proportion', 
-                door_2_lever_press_prop_of_presses]]
-
-###
-
-    summary+= [['mean door_1 lever press latency (excludes NaN)',
-            'mean_door_1_lever_press_latency',
-                round_df.door_1_lever_press_latency.mean()]]
-
-    summary+= [['mean door_2 lever press latency (excludes NaN)',
-            'mean_door_2_lever_press_latency',
-                round_df.door_2_lever_press_latency.mean()]]
-    
-    summary+= [['median door_1 lever press latency (excludes NaN)',
-            'median_door_1_lever_press_latency',
-                round_df.door_1_lever_press_latency.median()]]
-
-    summary+= [['median door_2 lever press latency (excludes NaN)',
-            'median_door_2_lever_press_latency',
-                round_df.door_2_lever_press_latency.median()]]
-
-    #####beambreak section######
-
-    d1_beambreaks = af.count_event(data, oes.beam_break_1)
-    d2_beambreaks = af.count_event(data, oes.beam_break_2)
-
-    summary+= [['number of door 1 beam breaks (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'door_1_beam_breaks',
-            d1_beambreaks]]
-
-    summary+= [['number of door 2 beam breaks (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'door_2_beam_breaks',
-            d2_beambreaks]]
-
-###
-
-    d1_openings = af.count_event(data, oes.door1_open_start)
-    prop_d1_beambreak_by_open = np.nan if not d1_openings else d1_beambreaks / d1_openings
-    summary+= [['proportion of door_1 opening on which the beam was subsequently broken',
-        'prop_d1_beambreak_by_open',
-            prop_d1_beambreak_by_open]]
-
-    d2_openings = af.count_event(data, oes.door2_open_start)
-    
-    prop_d2_beambreak_by_open = np.nan if not d2_openings else d2_beambreaks / d2_openings
-    summary+= [['proportion of door_2 opening on which the beam was subsequently broken',
-        'prop_d1_beambreak_by_open',
-            prop_d2_beambreak_by_open]]
-
-####
-    
-    prop_d1_beambreak_by_press = np.nan if not door_1_lever_press_count else d1_beambreaks / door_1_lever_press_count
-    
-
-    summary+= [['proportion of door_1 lever presses on which the beam was subsequently broken',
-        'prop_d1_beambreak_by_press',
-            prop_d1_beambreak_by_press]]
-
-    prop_d2_beambreak_by_press = np.nan if not door_2_lever_press_count else d2_beambreaks / door_2_lever_press_count
-    summary+= [['proportion of door_2 lever presses on which the beam was subsequently broken',
-        'prop_d2_beambreak_by_press',
-            prop_d2_beambreak_by_press]]
-
-###
-
-    summary+= [['mean door_1 beambreak latency (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'mean_door_1_beam_break_latency',
-            round_df.latency_beam_break_door1.mean()]]
-
-    summary+= [['mean door_2 beambreak latency (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'mean_door_2_beam_break_latency',
-            round_df.latency_beam_break_door2.mean()]]
-    
-    summary+= [['median door_1 beambreak latency (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'median_door_1_beam_break_latency',
-            round_df.latency_beam_break_door1.median()]]
-
-    summary+= [['median door_2 beambreak latency (max 1/round) (proxy for crossing, but could also be doorway investigation)',
-        'median_door_2_beam_break_latency',
-            round_df.latency_beam_break_door2.median()]]
-
-
-    ##### general info section #####
-
-
-    summary+= [['animal ID',
-            'animal_ID',
-                head['vole']]]
-
-    summary+= [['experiment day entered by experimenter',
-            'day',
-                head['day']]]
-    summary+= [['experiment script name',
-            'experiment',
-                head['experiment']]]
-    summary+= [['time of run',
-            'date',
-                head['run_time']]]
 
+def run_analysis(data_raw, head, by_round_fname, summary_fname):
+    data = af.remove_duplicate_events(data_raw, event_str = ' Levers out')
+    idx = af.SessionIndex(data)
+
+    #get latency from levers out to each door's lever presses
+    latencies = af.latencies_by_round(idx, 
+                                      {'door_1_lever_press_latency':{'event_1':oes.lever_out,
+                                                                     'event_2':oes.door1_leverpress_prod,
+                                                                     'selected_by':oes.door1_leverpress_prod},
+                                       'door_2_lever_press_latency':{'event_1':oes.lever_out,
+                                                                     'event_2':oes.door2_leverpress_prod,
+                                                                     'selected_by':oes.door2_leverpress_prod}},
+                                      include_missing_data_as_nan = False)
+    latencies.update(af.latency_to_beam_break(idx))
+    round_df = af.round_table(idx.round_numbers, latencies)
+
+    summary = SUMMARY_PLAN.evaluate(index = idx, round_df = round_df, head = head)
 
     summary_df = pd.DataFrame(data = summary, columns = ['var_desc','var_name','var'])
     summary_df = summary_df.transpose()
     
     
-    round_df.to_csv(by_round_fname)
-    header_string = af.create_header_string(head)
-    af.line_prepender(by_round_fname, header_string)
-    
-    summary_df.to_csv(summary_fname)
-    af.line_prepender(summary_fname, header_string)
\ No newline at end of file
+    af.write_session_outputs(head, 
+                             round_df = round_df, by_round_fname = by_round_fname,
+                             summary_df = summary_df, summary_fname = summary_fname)
+    return round_df, summary_df
@@ -2,6 +2,11 @@ import pandas as pd
 import numpy as np
 
 import os
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections.abc import MutableMapping
 
 import analysis_functions as af
 import longitudinal_functions as lf
@@ -20,28 +25,38 @@ class LongitudinalAnalysis:
         self.animal_order = None
         self.files = []
     
-    def save(self,filepath, overwrite = True):
+    def save(self, filepath, overwrite = True, legacy_pickle = False):
+        '''save the dataset as a directory in the versioned store format (see write_store), 
+        which can be opened lazily. legacy_pickle = True pickles the whole object instead.'''
         if os.path.exists(filepath):
             if overwrite:
                 print('this path exists and will be overwritten.')
-                with open(filepath, 'wb') as f:
-                    pickle.dump(self, f)
             else:
                 print('file already exists, and overwrite set to false. nothing saved.')
-        else:
+                return
+        
+        if legacy_pickle:
             with open(filepath, 'wb') as f:
                     pickle.dump(self, f)
+        else:
+            write_store(self, filepath)
                     
     def open(self, filepath):
-        if os.path.exists(filepath):
+        '''open a saved dataset. store directories are opened lazily, old pickles are unpickled'''
+        if os.path.isdir(filepath):
+            return LongitudinalAnalysis.load(filepath)
+        elif os.path.exists(filepath):
             with open(filepath, 'rb') as f:
                 return pickle.load(f)
         else:
             raise FileNotFoundError
-
-    
-    
     
+    @classmethod
+    def load(cls, filepath):
+        '''open a dataset saved in the store format. Only the metadata is read here, each 
+        metric is read from disk the first time it is used.'''
+        return read_store(filepath)
+
     def plottable_metrics(self):
             return self._plottable_metrics
         
@@ -49,6 +64,10 @@ class LongitudinalAnalysis:
         for metric in self.metrics.keys():
             if metric in self._plottable_metrics:
                 continue
+            
+            elif isinstance(self.metrics, LazyMetrics) and not self.metrics.is_loaded(metric):
+                #checked before the store was saved, no need to read it
+                continue
                 
             elif self.metrics[metric].plottable:
                 self._plottable_metrics += [metric]
@@ -96,6 +115,116 @@ class LongitudinalAnalysis:
             if file not in self.files:
                 self.files +=[file]
         
+    def add_summary_files(self, files):
+        '''bulk version of add_summary_csv. Reads every file, stacks them into one long table and 
+        adds each metric's rows in a single step, so dtypes are worked out and the data is 
+        sorted once per metric rather than once per value.
+        
+        files that cant be read are skipped with a message. returns a list of the DuplicateData 
+        conflicts found; those values are not added.'''
+        tables = []
+        for file in files:
+            try:
+                head, df = lf.read_summary_csv(file)
+                tables += [lf.summary_table(head, df, file)]
+            except:
+                print(f'could not add {file}, due to:\n{traceback.format_exc()}')
+        
+        if not tables:
+            return []
+        conflicts = self.add_summary_table(pd.concat(tables, ignore_index = True))
+        if conflicts:
+            print(f'{len(conflicts)} values were already present and were not added')
+        return conflicts
+    
+    def add_summary_table(self, table):
+        '''add a long table of summary values, with columns animal, day, experiment, var_name,
+        var_desc, value and file (eg. from lf.summary_table). returns a list of DuplicateData
+        conflicts, which are not added.'''
+        conflicts = []
+        
+        for experiment in table.experiment.unique():
+            if experiment not in self.experiments:
+                self.experiments += [experiment]
+        
+        for var_n, rows in table.groupby('var_name', sort = False):
+            if var_n not in self.metrics:
+                desc = rows.var_desc.iloc[0]
+                self.metrics[var_n] = Metric(var_n, desc, {col:[] for col in Metric.columns})
+            
+            conflicts += self.metrics[var_n].add_rows(rows[Metric.columns])
+        
+        self.set_plottable_metrics()
+        
+        new_files = set(table.file.unique()) - set(self.files)
+        self.files += [f for f in table.file.unique() if f in new_files]
+        return conflicts
+        
+    def add_by_round_table(self, table):
+        '''add a long table of by round values, with columns animal, experiment, day, Round, 
+        var_name, value and file (eg. from lf.round_long_table). returns a list of 
+        DuplicateRoundData conflicts, which are not added.'''
+        conflicts = []
+        for experiment in table.experiment.unique():
+            if experiment not in self.experiments:
+                self.experiments += [experiment]
+        
+        for var_n, rows in table.groupby('var_name', sort = False):
+            if var_n not in self.metrics:
+                self.metrics[var_n] = Metric_by_round(var_n)
+            conflicts += self.metrics[var_n].add_rows(rows[Metric_by_round.table_columns])
+        
+        new_files = set(table.file.unique()) - set(self.files)
+        self.files += [f for f in table.file.unique() if f in new_files]
+        return conflicts
+    
+    def add_files(self, files, n_workers = None, processes = False):
+        '''add many summary and by round csvs at once. Files are read and parsed concurrently,
+        then merged into the metrics here in one step per kind (add_summary_table and 
+        add_by_round_table), in the order the files were given.
+        
+        n_workers : number of parallel readers. Defaults to the number of cores. 
+                    n_workers = 1 reads everything in this thread.
+        processes : use a process pool rather than threads. Worth it for archives of thousands 
+                    of files, where csv parsing rather than disk access is the limit.
+        
+        returns a DataFrame with one row per file (in the order given) with columns file, 
+        kind ('summary' or 'by_round'), status ('ok', 'duplicate' or 'error'), error (traceback 
+        text), duplicates (how many of the file's values were already present and were not added),
+        conflicts (the DuplicateData / DuplicateRoundData for those values) and seconds. Nothing
+        is printed, so it is safe to use from a pool or the session watcher.'''
+        files = list(files)
+        n_workers = n_workers if n_workers else os.cpu_count()
+        
+        if n_workers == 1 or len(files) < 2:
+            results = [_read_one(f) for f in files]
+        else:
+            pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool_class(max_workers = n_workers) as pool:
+                futures = [pool.submit(_read_one, f) for f in files]
+                results = [future.result() for future in as_completed(futures)]
+            order = {f:i for i, f in enumerate(files)}
+            results = sorted(results, key = lambda res: order[res['file']])
+        
+        conflicts = []
+        for kind, add in (('summary', self.add_summary_table), ('by_round', self.add_by_round_table)):
+            tables = [res.pop('table') for res in results if res['kind'] == kind and res['status'] == 'ok']
+            if tables:
+                conflicts += add(pd.concat(tables, ignore_index = True))
+        
+        by_file = {}
+        for conflict in conflicts:
+            by_file.setdefault(conflict.new_file, []).append(conflict)
+        for res in results:
+            res.pop('table', None)
+            res['conflicts'] = by_file.get(res['file'], [])
+            res['duplicates'] = len(res['conflicts'])
+            if res['conflicts']:
+                res['status'] = 'duplicate'
+        
+        return pd.DataFrame(results, columns = ['file', 'kind', 'status', 'error', 'duplicates', 
+                                                'conflicts', 'seconds'])
+        
     def add_by_round_csv(self, file):
         
         head, df = lf.read_round_csv(file)
@@ -129,10 +258,25 @@ class LongitudinalAnalysis:
         
         
 
+def _read_one(file):
+    '''worker for LongitudinalAnalysis.add_files. never raises, so one bad file cant stop 
+    the others. returns a row for the results table, with the parsed table under "table".'''
+    start = time.perf_counter()
+    result = {'file':file, 'kind':None, 'status':'ok', 'error':None, 'table':None}
+    try:
+        result['kind'], result['table'] = lf.read_output_table(file)
+    except Exception:
+        result['status'] = 'error'
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
 class Metric:
     '''An object that is a single metric from the summary datasets. contains some basic
     information about the metric and some attributes that are useful for longitudinal experiments.'''
     
+    columns = ['animal', 'day', 'value', 'experiment', 'file']
+    
     def __init__(self, name, var_desc, first_row):
         self.name = name
         self.description = var_desc
@@ -141,6 +285,30 @@ class Metric:
         self.plottable = False
         self._do_not_plot = ['day', 'date']
         self._plottable_types = [int, float]
+        self._build_index()
+    
+    @staticmethod
+    def key(animal, experiment, day):
+        '''key of a value in the index'''
+        return int(animal), str(experiment), int(float(day))
+    
+    def _build_index(self):
+        '''{(animal, experiment, day) : row label of self.data}, kept in sync on every insert so 
+        duplicate checks and lookups dont have to scan the data'''
+        self._index = {self.key(a, e, d):label for label, a, e, d in 
+                       zip(self.data.index, self.data.animal, self.data.experiment, self.data.day)}
+        self._next_label = max(self.data.index, default = -1) + 1
+    
+    def _ensure_index(self):
+        #metrics pickled before the index existed build it the first time they are used
+        if not hasattr(self, '_index'):
+            self._build_index()
+    
+    def get_value(self, animal, experiment, day):
+        '''the value for one animal, experiment and day, or None if there isnt one'''
+        self._ensure_index()
+        label = self._index.get(self.key(animal, experiment, day))
+        return None if label is None else self.data.at[label, 'value']
     
     def check_plottable(self):
         if self.name in self._do_not_plot:
@@ -155,29 +323,30 @@ class Metric:
     
     '''def add_data(self, animal_num, day, value, experiment, file):'''
     def add_data(self, new_row):
+        self._ensure_index()
         animal_num = new_row['animal'][0]
         day = int(float(new_row['day'][0]))
         exp = new_row['experiment'][0]
+        key = self.key(animal_num, exp, day)
         #check if this day is already occupied within this metric
-        if len(self.data.loc[(self.data.animal == animal_num) & 
-                             (self.data.day == day) &
-                             (self.data.experiment == exp), 'value']) > 0:
-            old_val = self.data.loc[(self.data.animal == animal_num) & (self.data.day == day), 'value'].values[0]
-            old_file = self.data.loc[(self.data.animal == animal_num) & (self.data.day == day), 'file'].values[0]
+        if key in self._index:
+            old_val, old_file = self.data.loc[self._index[key], ['value', 'file']]
             value = new_row['value']
             file = new_row['file']
             
             raise DuplicateData(self.name, animal_num, day,old_val , value, old_file, file, exp)
         
-
-        new_row = pd.DataFrame(data = new_row, index=[len(self.data)+1])
+        label = self._next_label
+        new_row = pd.DataFrame(data = new_row, index=[label])
+        self._index[key] = label
+        self._next_label += 1
         
         dtype = self.intuit_dtype(new_row)
         if dtype != self.data_type:
             self.data_type = dtype
         self.check_plottable()
         
-        self.data = self.data.append(new_row)
+        self.data = pd.concat((self.data, new_row))
         
         self.data = self.data.astype({'day':float})
         self.data = self.data.astype({'value':self.data_type, 'day':int})
@@ -185,13 +354,60 @@ class Metric:
         
         
         
+    def add_rows(self, rows):
+        '''add many rows at once. rows is a DataFrame with the Metric.columns. 
+        
+        rows whose animal, experiment and day are already present, or repeated within rows, are
+        not added. returns a DuplicateData for each of them.'''
+        self._ensure_index()
+        rows = rows.astype({'day':float}).astype({'day':int})
+        rows.index = pd.RangeIndex(self._next_label, self._next_label + len(rows))
+        
+        clash = np.zeros(len(rows), dtype = bool)
+        conflicts = []
+        for i, row in enumerate(rows.itertuples()):
+            key = self.key(row.animal, row.experiment, row.day)
+            if key in self._index:
+                clash[i] = True
+                label = self._index[key]
+                old_val, old_file = (self.data.loc[label, ['value', 'file']] if label in self.data.index 
+                                     else rows.loc[label, ['value', 'file']])
+                conflicts += [DuplicateData(self.name, row.animal, row.day, old_val, row.value, 
+                                            old_file, row.file, row.experiment)]
+            else:
+                self._index[key] = row.Index
+        self._next_label += len(rows)
+        
+        existing = [self.data[self.columns]] if len(self.data) else []
+        self.data = pd.concat(existing + [rows.loc[~clash, self.columns]])
+        
+        dtype = self.intuit_column_dtype(self.data.value)
+        if dtype != self.data_type:
+            self.data_type = dtype
+        self.check_plottable()
+        self.data = self.data.astype({'value':self.data_type, 'day':int})
+        self.sort_data()
+        
+        return conflicts
+    
+    def intuit_column_dtype(self, values):
+        '''intuit_dtype for a whole column at once: float if every value is a number (or nan), 
+        str if any isnt, and the column's own dtype if it is already numeric'''
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            return float if values.isna().any() else values.dtype
+        
+        numeric = pd.to_numeric(values, errors = 'coerce')
+        text = values.astype(str).str.strip().str.lower()
+        failed = numeric.isna() & values.notna() & ~text.isin(['nan', ''])
+        return str if failed.any() else float
+    
     def sort_data(self):
         self.data.sort_values(['animal','experiment','day'], inplace = True)
     
     def intuit_dtype(self, new_row):
         dtype = new_row.value.dtype
         val = new_row.value.values[0]
-        if isinstance(dtype, str) or dtype == 'O':
+        if isinstance(dtype, str) or dtype == 'O' or pd.api.types.is_string_dtype(dtype):
             try:
                 a = float(val)
                 return float
@@ -238,70 +454,313 @@ class DuplicateRoundData(Exception):
 
 
 class Metric_by_round:
-    '''An object that '''
+    '''A single by round metric for every animal, experiment and day. 
+    
+    The data is one long table indexed by (animal, experiment, day, Round) with a value column
+    and a file_id pointing into self.files, so any combination of animal / experiment / day is
+    an index lookup (get_table), and a whole cohort can be analyzed in one call, eg.
+    metric.get_table(experiment = 'Door_test').groupby('day').value.median()'''
+    
+    #one value per round, nothing to plot longitudinally
+    plottable = False
+    
+    index_names = ['animal', 'experiment', 'day', 'Round']
+    table_columns = index_names + ['value', 'file']
+    
     def __init__(self, name):
         self.name = name
+        self.files = []
         
-        #{ animal -> experiment -> day }
-        self.data = {}
-        self.animal_order = []
+        #{(animal, experiment, day) : file_id}, for duplicate checks
+        self._index = {}
+        #added since the table was last sorted, merged in on the next read
+        self._pending = []
+        self._table = self._empty_table()
+    
+    def _empty_table(self):
+        index = pd.MultiIndex.from_arrays([np.array([], dtype = int), np.array([], dtype = object), 
+                                           np.array([], dtype = int), np.array([], dtype = int)], 
+                                          names = self.index_names)
+        return pd.DataFrame({'value':np.array([], dtype = float), 'file_id':np.array([], dtype = np.int32)}, 
+                            index = index)
+    
+    def __setstate__(self, state):
+        if 'data' in state:
+            #pickled before the long table existed: {animal: {experiment: {day: df}}}
+            old = state['data']
+            self.__init__(state['name'])
+            for a in old:
+                for e in old[a]:
+                    for d, frame in old[a][e].items():
+                        self.add_data(a, e, d, frame[['Round', 'value']], frame['file'].values[0])
+        else:
+            self.__dict__.update(state)
+    
+    @property
+    def table(self):
+        '''the (animal, experiment, day, Round) indexed table of value and file_id'''
+        if self._pending:
+            self._table = pd.concat([self._table] + self._pending).sort_index()
+            self._pending = []
+        return self._table
+    
+    @property
+    def animal_order(self):
+        return sorted({key[0] for key in self._index})
+    
+    def _file_id(self, file):
+        if not hasattr(self, '_file_ids'):
+            self._file_ids = {f:i for i, f in enumerate(self.files)}
+        if file not in self._file_ids:
+            self._file_ids[file] = len(self.files)
+            self.files += [file]
+        return self._file_ids[file]
+    
+    def add_rows(self, rows):
+        '''add a long table with columns animal, experiment, day, Round, value and file. 
+        sessions (animal, experiment, day) that are already present are not added; a 
+        DuplicateRoundData is returned for each of them.'''
+        conflicts = []
+        keep = []
+        for (a, e, d, file), frame in rows.groupby(['animal', 'experiment', 'day', 'file'], sort = False):
+            key = Metric.key(a, e, d)
+            if key in self._index:
+                conflicts += [DuplicateRoundData(self.name, a, e, d, self.files[self._index[key]], file)]
+                continue
+            self._index[key] = self._file_id(file)
+            keep += [frame.index]
         
+        if keep:
+            new = rows.loc[np.concatenate(keep)]
+            file_ids = new.file.map(self._file_ids).to_numpy(dtype = np.int32)
+            index = pd.MultiIndex.from_arrays([new.animal.to_numpy().astype(float).astype(int),
+                                               new.experiment.to_numpy().astype(str).astype(object),
+                                               new.day.to_numpy().astype(float).astype(int),
+                                               new.Round.to_numpy().astype(int)],
+                                              names = self.index_names)
+            self._pending += [pd.DataFrame({'value':new.value.to_numpy(dtype = float), 'file_id':file_ids}, 
+                                           index = index)]
+        return conflicts
     
-    def get_data(self, experiment, day = None, animal = None, order = None):
+    def add_data(self, animal_num, experiment, day, df, file):
+        '''add one session\'s values. df has columns Round and value'''
+        key = Metric.key(animal_num, experiment, day)
+        if key in self._index:
+            raise DuplicateRoundData(self.name, animal_num, experiment, day, self.files[self._index[key]], file)
+        
+        self.add_rows(pd.DataFrame({'animal':animal_num, 'experiment':experiment, 'day':day,
+                                    'Round':df['Round'].to_numpy(), 'value':df['value'].to_numpy(), 
+                                    'file':file}))
+    
+    def get_table(self, animal = None, experiment = None, day = None):
+        '''long table (animal, experiment, day, Round, value, file) of the selected sessions.
+        animal, experiment and day can each be a single value, a list, or None for all of them.
+        values in a list that dont exist are ignored.'''
+        table = self.table
+        selection = []
+        for level, value in zip(self.index_names, (animal, experiment, day)):
+            if value is None:
+                selection += [slice(None)]
+            else:
+                values = [value] if np.isscalar(value) else list(value)
+                present = table.index.levels[self.index_names.index(level)]
+                selection += [[v for v in values if v in present]]
+        
+        if any(isinstance(sel, list) and not sel for sel in selection):
+            out = table.iloc[:0]
+        else:
+            out = table.iloc[table.index.get_locs(selection)]
         
+        out = out.reset_index()
+        out['file'] = np.asarray(self.files, dtype = object)[out.pop('file_id').to_numpy()]
+        return out
+    
+    def to_table(self):
+        '''all the data as one long table with columns animal, experiment, day, Round, value, file'''
+        return self.get_table()
+    
+    @classmethod
+    def from_table(cls, name, table):
+        '''rebuild a Metric_by_round from the long table made by to_table'''
+        metric = cls(name)
+        metric.add_rows(table)
+        return metric
+    
+    def _session_frames(self, table, by):
+        return {key:frame[['Round', 'value', 'file']].reset_index(drop = True) 
+                for key, frame in table.groupby(by, sort = True)}
+    
+    def get_data(self, experiment, day = None, animal = None, order = None):
+        '''per session frames of Round, value and file, nested the same way as before the long
+        table. get_table is faster for anything that doesnt need a frame per session.'''
         animal_order = order if order else self.animal_order
         
         if animal and day:
-            
-            out = self.data[animal][experiment][day]
+            out = self.get_table(animal, experiment, day)
+            if out.empty:
+                raise KeyError((animal, experiment, day))
+            out = out[['Round', 'value', 'file']]
         
         elif day:
-            
-            out = {ani:self.data[ani][experiment][day] for ani in animal_order}
+            frames = self._session_frames(self.get_table(animal_order, experiment, day), 'animal')
+            out = {ani:frames[ani] for ani in animal_order}
         
         elif animal:
-            out = self.data[animal][experiment]
+            out = self._session_frames(self.get_table(animal, experiment), 'day')
     
         else:
-            out = {ani:self.data[ani][experiment] for ani in animal_order}
+            table = self.get_table(animal_order, experiment)
+            out = {ani:self._session_frames(frame, 'day') for ani, frame in table.groupby('animal')}
+            out = {ani:out[ani] for ani in animal_order}
             
         return out
-            
-    def add_data(self, animal_num, experiment, day, df, file):
-        df['file'] = file
-        if animal_num in self.data.keys():
-            
-            if experiment in self.data[animal_num].keys():
-                if day in self.data[animal_num][experiment].keys():
-                    old_file = self.data[animal_num][experiment][day]['file'].values[0]
-                    raise DuplicateRoundData(self.name, animal_num, experiment, day, old_file, file)
-                else:
-                    self.data[animal_num][experiment][day] = df
+
+
+########## versioned on-disk store ##########
+#
+#   <path>/metadata.json         everything but the data, and where to find each metric
+#   <path>/metrics/<n>/<col>.npy one numpy file per column of each metric's table
+#
+#columns are plain .npy files (strings as fixed width unicode) so they can be memory mapped
+#and never need unpickling.
+
+store_format_version = 1
+
+_data_type_names = {str:'str', float:'float', int:'int'}
+
+def _data_type_to_json(data_type):
+    return _data_type_names.get(data_type, np.dtype(data_type).str)
+
+def _data_type_from_json(name):
+    lookup = {v:k for k, v in _data_type_names.items()}
+    return lookup[name] if name in lookup else np.dtype(name)
+
+def _write_table(table, directory):
+    os.makedirs(directory)
+    columns = {}
+    for col in table.columns:
+        values = table[col].to_numpy()
+        if not (np.issubdtype(values.dtype, np.number) or np.issubdtype(values.dtype, np.bool_)):
+            values = values.astype(str)
+        np.save(os.path.join(directory, f'{len(columns)}.npy'), values, allow_pickle = False)
+        columns[col] = f'{len(columns)}.npy'
+    return columns
+
+def _read_table(directory, columns):
+    data = {}
+    for col, fname in columns.items():
+        values = np.load(os.path.join(directory, fname), mmap_mode = 'r', allow_pickle = False)
+        data[col] = values.astype(object) if values.dtype.kind == 'U' else values
+    return pd.DataFrame(data, copy = False)
+
+def write_store(dataset, filepath):
+    '''write a LongitudinalAnalysis in the versioned store format. The store is written next to
+    filepath and moved into place, replacing whatever was there.'''
+    tmp_path = filepath.rstrip('/') + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    
+    metadata = {'format_version':store_format_version,
+                'experiment_name':dataset.experiment_name,
+                'experiments':list(dataset.experiments),
+                'animal_order':None if dataset.animal_order is None else [int(a) for a in dataset.animal_order],
+                'files':list(dataset.files),
+                'plottable_metrics':list(dataset._plottable_metrics),
+                'metrics':{},
+                'metrics_by_round':{}}
+    
+    n = 0
+    for section in ('metrics', 'metrics_by_round'):
+        for name, metric in getattr(dataset, section).items():
+            directory = os.path.join('metrics', str(n))
+            n += 1
+            if isinstance(metric, Metric):
+                entry = {'kind':'summary',
+                         'description':metric.description,
+                         'data_type':_data_type_to_json(metric.data_type),
+                         'plottable':metric.plottable}
+                table = metric.data[Metric.columns]
             else:
-                #if we dont have this experiment yet, we must create a new heirarchy
-                #                  animal
-                #                     |
-                #                    ----
-                #                    |   |
-                #          experiment 1  experiment 2
-                #           |    |        |    |    |
-                #         day1  day2     day1 day2 day3
-                self.data[animal_num][experiment] = {day:df}
-                
-        else:
-            #if we dont have this animal yet, we must create a new heirarchy
-            #                  animal
-            #                     |
-            #                    ----
-            #                    |   |
-            #          experiment 1  experiment 2
-            #           |    |        |    |    |
-            #         day1  day2     day1 day2 day3
-            
-            self.data[animal_num]={experiment:{day:df}}
-            
-            #add new animal to the animal order to be used when fetching data
-            self.animal_order +=[animal_num]
-            self.animal_order = sorted(self.animal_order)
-        
-            
+                entry = {'kind':'by_round'}
+                table = metric.to_table()
+            entry['dir'] = directory
+            entry['columns'] = _write_table(table, os.path.join(tmp_path, directory))
+            metadata[section][name] = entry
+    
+    with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent = 1)
+    
+    if os.path.isdir(filepath):
+        shutil.rmtree(filepath)
+    elif os.path.exists(filepath):
+        os.remove(filepath)
+    os.replace(tmp_path, filepath)
+
+def _load_metric(filepath, name, entry):
+    table = _read_table(os.path.join(filepath, entry['dir']), entry['columns'])
+    if entry['kind'] == 'by_round':
+        return Metric_by_round.from_table(name, table)
+    
+    metric = Metric(name, entry['description'], table)
+    metric.data_type = _data_type_from_json(entry['data_type'])
+    metric.plottable = entry['plottable']
+    return metric
+
+class LazyMetrics(MutableMapping):
+    '''dict of metrics that reads each metric from a store the first time it is looked up.
+    Listing names or checking membership never touches the data.'''
+    
+    def __init__(self, filepath, entries):
+        self._filepath = filepath
+        self._entries = dict(entries)
+        self._loaded = {}
+    
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            if name not in self._entries:
+                raise KeyError(name)
+            self._loaded[name] = _load_metric(self._filepath, name, self._entries[name])
+        return self._loaded[name]
+    
+    def __setitem__(self, name, metric):
+        self._loaded[name] = metric
+        self._entries.setdefault(name, None)
+    
+    def __delitem__(self, name):
+        del self._entries[name]
+        self._loaded.pop(name, None)
+    
+    def __iter__(self):
+        return iter(self._entries)
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, name):
+        return name in self._entries
+    
+    def is_loaded(self, name):
+        return name in self._loaded
+    
+    def __reduce__(self):
+        #pickles as a plain dict, so a pickled dataset doesnt depend on the store still existing
+        return (dict, (dict(self.items()),))
+
+def read_store(filepath):
+    '''open a LongitudinalAnalysis written by write_store, without reading any metric data'''
+    with open(os.path.join(filepath, 'metadata.json')) as f:
+        metadata = json.load(f)
+    
+    if metadata['format_version'] > store_format_version:
+        raise ValueError(f'{filepath} was written by a newer version (format {metadata["format_version"]}), '
+                         f'this code reads up to format {store_format_version}')
+    
+    dataset = LongitudinalAnalysis(metadata['experiment_name'])
+    dataset.experiments = metadata['experiments']
+    dataset.animal_order = metadata['animal_order']
+    dataset.files = metadata['files']
+    dataset._plottable_metrics = metadata['plottable_metrics']
+    dataset.metrics = LazyMetrics(filepath, metadata['metrics'])
+    dataset.metrics_by_round = LazyMetrics(filepath, metadata['metrics_by_round'])
+    return dataset
@@ -4,48 +4,133 @@ import os
 import analysis_functions as af
 
 def read_summary_csv(filepath):
-    head = af.get_header(filepath, skiplines = 0)
-    df = pd.read_csv(filepath, header = 1)
+    head, df = af.read_headed_csv(filepath, skiplines = 0)
     df.set_index('Unnamed: 0', inplace = True)
     return head, df.transpose()
     
     
 def read_round_csv(filepath):
-    head = af.get_header(filepath, skiplines = 0)
-    df = pd.read_csv(filepath, header = 1)
+    head, df = af.read_headed_csv(filepath, skiplines = 0)
     
     return head, df
 
-def get_data(metric: str, experiment: str, dataset, days:list = None):
-        
-        
-        if not metric in dataset.metrics:
-            print(f'metric: {metric} not found in dataset')
+def summary_table(head, df, file):
+    '''long table of one summary file, as returned by read_summary_csv, with one row per var_name 
+    and columns animal, day, experiment, var_name, var_desc, value, file'''
+    return pd.DataFrame({'animal':int(float(head['vole'])),
+                         'day':int(float(head['day'])),
+                         'experiment':head['experiment'],
+                         'var_name':df.var_name.to_numpy(),
+                         'var_desc':df.var_desc.to_numpy(),
+                         'value':df['var'].to_numpy(),
+                         'file':file})
+
+def round_long_table(head, df, file):
+    '''long table of one by round file, as returned by read_round_csv, with one row per round 
+    and metric and columns animal, experiment, day, Round, var_name, value, file'''
+    values = df.drop(columns = [col for col in ['Unnamed: 0'] if col in df.columns])
+    long = values.melt(id_vars = 'Round', var_name = 'var_name', value_name = 'value')
+    long.insert(0, 'animal', int(float(head['vole'])))
+    long.insert(1, 'experiment', head['experiment'])
+    long.insert(2, 'day', int(float(head['day'])))
+    long['file'] = file
+    return long
+
+def read_output_table(file):
+    '''read a summary or by round csv into its long table (summary_table or round_long_table),
+    going by the file name. returns kind ('summary' or 'by_round'), table'''
+    if file.endswith('_summary.csv'):
+        head, df = read_summary_csv(file)
+        return 'summary', summary_table(head, df, file)
+    elif file.endswith('_analysis_by_round.csv'):
+        head, df = read_round_csv(file)
+        return 'by_round', round_long_table(head, df, file)
+    else:
+        raise ValueError(f'{file} is not a summary or by round csv')
+
+def get_data(metric, experiment: str, dataset, days:list = None):
+    '''animal x day matrix of a metric for one experiment, for heatmaps.
+    
+    metric  : name of a metric, or a list of names to get a 3-D array of (metric, animal, day)
+    days    : days to include, in order. Defaults to every day any animal has data for.
+    
+    rows follow dataset.animal_order if it is set, otherwise sorted animal number. cells 
+    without data are NaN. returns animals, days, matrix'''
+    metrics = [metric] if isinstance(metric, str) else list(metric)
+    
+    data = []
+    for name in metrics:
+        if not name in dataset.metrics:
+            print(f'metric: {name} not found in dataset')
             return None
-        met = dataset.metrics[metric].data
-        data = met.loc[met.experiment == experiment]
-        
-        anis = dataset.animal_order if dataset.animal_order else sorted(data.animal.unique() )
-        
-        if days == None:
-            days = sorted(data.day.unique() )
+        met = dataset.metrics[name].data
+        data += [met.loc[met.experiment == experiment, ['animal', 'day', 'value']]]
+    
+    anis = dataset.animal_order if dataset.animal_order else sorted(pd.unique(np.concatenate([d.animal.to_numpy() for d in data])))
+    
+    if days == None:
+        days = sorted(pd.unique(np.concatenate([d.day.to_numpy() for d in data])))
+    
+    out = np.stack([d.drop_duplicates(['animal', 'day'])
+                     .pivot(index = 'animal', columns = 'day', values = 'value')
+                     .reindex(index = anis, columns = days)
+                     .to_numpy(dtype = float) for d in data])
+    
+    return anis, days, out[0] if isinstance(metric, str) else out
+
 
-        out = np.empty((len(anis), len(days)))
-        out[:,:] = np.nan
+values_table_columns = ['animal', 'day', 'sex', 'value', 'experiment', 'metric']
+categorical_columns = ['sex', 'experiment', 'metric']
 
-        for i, ani in enumerate(anis):
+def _values_frame(data, animal_numbers, sex_list, days, experiment, metrics):
+    '''long table of a (metric, animal, day) array, built with repeat/tile rather than a frame 
+    per animal. columns are left uncategorized so pieces can be concatenated cheaply'''
+    data = np.asarray(data, dtype = float)
+    n_met, n_ani, n_day = data.shape
+    
+    if n_day != len(days):
+        raise Exception('data and days length mismatch')
+    
+    return pd.DataFrame({'animal':np.tile(np.repeat(np.asarray(animal_numbers), n_day), n_met),
+                         'day':np.tile(np.asarray(days), n_met * n_ani),
+                         'sex':np.tile(np.repeat(np.asarray(sex_list), n_day), n_met),
+                         'value':data.ravel(),
+                         'experiment':experiment,
+                         'metric':np.repeat(np.asarray(metrics), n_ani * n_day)},
+                        columns = values_table_columns)
 
-            ani_slice = data.loc[data.animal == ani]
-            
-            
-            for j, d in enumerate(days):
-                if d in ani_slice.day.unique():
-                    val = ani_slice.loc[ani_slice.day == d, 'value'].values[0]
-                    
-                    out[i,j] = val
-                    
-        return anis, days, out
+def _categorize(table):
+    return table.astype({col:'category' for col in categorical_columns})
 
+class ValuesTableBuilder:
+    '''collects values for many metrics and experiments and builds the long table (eg. for 
+    pingouin) with a single concatenate at the end, instead of concatenating once per metric.
+    
+    builder = ValuesTableBuilder()
+    for metric in metrics:
+        ani, days, vals = get_data(metric, experiment, dataset)
+        builder.add(vals, ani, sexes, days, experiment, metric)
+    table = builder.table()'''
+    
+    def __init__(self):
+        self.pieces = []
+    
+    def add(self, data, animal_numbers, sex_list, days, experiment, metric):
+        '''data is an animal x day array for one metric, or a metric x animal x day array 
+        (eg. from get_data with a list of metrics) with metric a list of names'''
+        data = np.asarray(data, dtype = float)
+        if isinstance(days, int):
+            days = [days]
+        if data.ndim == 2:
+            data = data[np.newaxis]
+            metric = [metric]
+        self.pieces += [_values_frame(data, animal_numbers, sex_list, days, experiment, metric)]
+        return self
+    
+    def table(self):
+        if not self.pieces:
+            return _categorize(pd.DataFrame(columns = values_table_columns))
+        return _categorize(pd.concat(self.pieces, ignore_index = True))
 
 def update_values_table(data, animal_numbers, sex_list, days, experiment, metric, values_table):
     '''data           --> numpy arrays
@@ -53,15 +138,18 @@ def update_values_table(data, animal_numbers, sex_list, days, experiment, metric
     sex_list       --> iterable of animal sex, corresponding with animal_numbers
     days           --> int or, preferably, list of days corresponding with values in data
     experiment     --> experiment name for lookup
-    metric         --> name of the value being used'''
-    return pd.concat((values_table, 
-                      generate_values_table(data = data, 
-                                            animal_numbers = animal_numbers, 
-                                            sex_list = sex_list, 
-                                            days = days, 
-                                            experiment = experiment, 
-                                            metric = metric)), 
-                                            ignore_index=True)
+    metric         --> name of the value being used
+    
+    when adding many metrics, use a ValuesTableBuilder instead of calling this in a loop'''
+    new = generate_values_table(data = data, 
+                                animal_numbers = animal_numbers, 
+                                sex_list = sex_list, 
+                                days = days, 
+                                experiment = experiment, 
+                                metric = metric)
+    return _categorize(pd.concat((values_table.astype({col:object for col in categorical_columns}), 
+                                  new.astype({col:object for col in categorical_columns})), 
+                                 ignore_index = True))
  
 def generate_values_table(data, animal_numbers, sex_list, days, experiment, metric):
     '''data            --> numpy arrays
@@ -69,32 +157,9 @@ def generate_values_table(data, animal_numbers, sex_list, days, experiment, metr
         sex_list       --> iterable of animal sex, corresponding with animal_numbers
         days           --> int or, preferably, list of days corresponding with values in data
         experiment     --> experiment name for lookup
-        metric         --> name of the value being used'''
-    output_df = pd.DataFrame(columns = ['animal', 'day', 'sex', 'value', 'experiment', 'metric'])
-    if isinstance(days, int):
-        
-        #double check we only have 1 day of data
-        if len(data[0]) == 1:
-            tmp = np.insert(data, values = animal_numbers, obj = 0, axis = 1)
-            tmp = np.insert(data, values = sex_list, obj = 1, axis = 1)
-            tmp = np.insert(tmp, values = days)
-            tmp_df = pd.DataFrame(tmp, columns = ['animal', 'day', 'value'])
-            output_df = pd.concat((output_df, tmp_df), ignore_index = True)
-            output_df['experiment'] = experiment
-            output_df['metric'] = metric
-    else:
+        metric         --> name of the value being used, or a list of names if data is a 
+                           metric x animal x day array
         
-        if len(data[0]) != len(days):
-            
-            raise Exception('data and days length mismatch')
-        else:
-            
-            for ani_data, animal, sex in zip(data, animal_numbers, sex_list):
-                tmp_df = pd.DataFrame(ani_data, columns = ['value'])
-                tmp_df['day'] = days
-                tmp_df['animal'] = animal
-                tmp_df['sex'] = sex
-                tmp_df['experiment'] = experiment
-                tmp_df['metric'] = metric
-                output_df = pd.concat((output_df, tmp_df), ignore_index = True)
-    return output_df
\ No newline at end of file
+        returns a long DataFrame with columns animal, day, sex, value, experiment and metric, 
+        with sex, experiment and metric categorical'''
+    return ValuesTableBuilder().add(data, animal_numbers, sex_list, days, experiment, metric).table()
@@ -61,4 +61,14 @@ class Operant_event_strings:
     
     #I kept the space for now
     #also may need to add others, I was working from a door shape file
-    #maybe don't need all of these either but just to be safe
\ No newline at end of file
+    #maybe don't need all of these either but just to be safe
+
+
+def known_events():
+    '''every event string defined on Operant_event_strings, in the order they are defined.
+    This is the registry used to encode the Event column as a categorical.'''
+    events = []
+    for name, val in vars(Operant_event_strings).items():
+        if not name.startswith('_') and isinstance(val, str) and val not in events:
+            events += [val]
+    return events
@@ -4,43 +4,29 @@ import sys
 import analysis_functions as af
 from lookup_classes import Operant_event_strings as oes
 import pandas as pd
-import numpy as np
 
 
 def run_analysis(data_raw, head, by_round_fname, summary_fname):
     data = data_raw
-    #calculations: food lever lat, pellet lat, percent press
-    event_1 = oes.lever_out
-    event_2 = oes.food_leverpress_prod
-    
-    col_name = 'food_lever_press_latency'
-    
-    new_col, new_data = af.latency_by_round(data, event_1, event_2, 
-                                             new_col_name = col_name, 
-                                             selected_by = event_2)
+    idx = af.SessionIndex(data)
 
-    new_df_blank = np.asarray([[r, np.nan] for r in data.Round.unique()])
-    
-    new_df = pd.DataFrame(data = new_df_blank, columns = ['Round',new_col])
-    new_df = new_df.astype({'Round':int})
-    new_df = af.roundwise_join(new_df, new_data, new_col)
-
-    # pellet lat
-    event_1 = oes.disp
-    event_2 = oes.retr
-    col_name = 'pellet_latency'
-    new_col, new_data = af.latency_by_round(data, event_1, event_2, new_col_name = col_name)
-    round_df = af.roundwise_join(new_df, new_data, new_col)
-    
+    #calculations: food lever lat, pellet lat, percent press
+    latencies = af.latencies_by_round(idx, 
+                                      {'food_lever_press_latency':{'event_1':oes.lever_out,
+                                                                   'event_2':oes.food_leverpress_prod,
+                                                                   'selected_by':oes.food_leverpress_prod},
+                                       'pellet_latency':(oes.disp, oes.retr)},
+                                      include_missing_data_as_nan = False)
+    round_df = af.round_table(idx.round_numbers, latencies)
 
     summary = []
 
-    total_rounds = data.Round.max()
+    total_rounds = idx.max_round
     summary += [['number of rounds in experiment', 'rounds', total_rounds]]
 
     '''calculate the values for the days summary'''
     #calculate number of presses
-    total_presses = len(data.loc[data.Event == oes.food_leverpress_prod])
+    total_presses = idx.count(oes.food_leverpress_prod)
     summary += [['total number of lever presses', 'total_lever_press', total_presses]]
     
     non_presses = total_rounds - total_presses
@@ -72,7 +58,7 @@ def run_analysis(data_raw, head, by_round_fname, summary_fname):
                 round_df.pellet_latency.median()]]
     
     
-    pel_retrievals = af.count_event(data, oes.retr)
+    pel_retrievals = af.count_event(idx, oes.retr)
     summary+= [['number of times a pellet was retrieved',
             'num_pellet_retrieved',
                 pel_retrievals]]
@@ -81,7 +67,7 @@ def run_analysis(data_raw, head, by_round_fname, summary_fname):
             'proportion_round_pellet_retrieved',
                 pel_retrievals / total_rounds]]
     
-    dispensed = af.count_event(data, oes.disp)
+    dispensed = af.count_event(idx, oes.disp)
     summary+= [['proportion of pellets retrieved',
             'proportion_pellet_retrieved',
                 pel_retrievals / dispensed]]
@@ -89,11 +75,11 @@ def run_analysis(data_raw, head, by_round_fname, summary_fname):
     
     summary+= [['animal ID',
             'animal_ID',
-                head['vole']]]
+                str(head['vole'])]]
 
     summary+= [['experiment day entered by experimenter',
             'day',
-                head['day']]]
+                str(head['day'])]]
     summary+= [['experiment script name',
             'experiment',
                 head['experiment']]]
@@ -106,12 +92,7 @@ def run_analysis(data_raw, head, by_round_fname, summary_fname):
     summary_df = summary_df.transpose()
     
     
-    round_df.to_csv(by_round_fname)
-    header_string = af.create_header_string(head)
-    af.line_prepender(by_round_fname, header_string)
-    
-    summary_df.to_csv(summary_fname)
-    af.line_prepender(summary_fname, header_string)
-
-
-    
+    af.write_session_outputs(head, 
+                             round_df = round_df, by_round_fname = by_round_fname,
+                             summary_df = summary_df, summary_fname = summary_fname)
+    return round_df, summary_df
@@ -0,0 +1,197 @@
+import inspect
+import numpy as np
+
+from lookup_classes import Operant_event_strings as oes
+
+#values every plan can ask for, handed to SummaryPlan.evaluate by the analysis script
+plan_inputs = ('index', 'round_df', 'head')
+
+class MetricSpec:
+    '''a single named value computed from a session.
+
+    formula is a function whose argument names are the names of the values it needs: any of
+    plan_inputs (the SessionIndex, the by round table or the header) or the name of another
+    MetricSpec. eg. MetricSpec('total_presses', lambda d1_presses, d2_presses: d1_presses + d2_presses)
+
+    specs with a description are written to the summary, specs without one are intermediates
+    that only exist to be shared between other specs.'''
+
+    def __init__(self, name, formula, description = None):
+        self.name = name
+        self.formula = formula
+        self.description = description
+        self.requires = tuple(inspect.signature(formula).parameters)
+
+    def __repr__(self):
+        return f'MetricSpec({self.name}, requires = {self.requires})'
+
+class SummaryPlan:
+    '''an ordered list of specs to compute for a session, built by compile_plan.
+    every spec the summary depends on is computed exactly once, after its requirements.'''
+
+    def __init__(self, outputs, steps):
+        self.outputs = outputs
+        self.steps = steps
+
+    def evaluate(self, **inputs):
+        '''compute the plan for one session. inputs are the plan_inputs (index, round_df, head).
+        returns the summary rows as [[var_desc, var_name, var], ...]'''
+        values = dict(inputs)
+        for spec in self.steps:
+            values[spec.name] = spec.formula(*[values[req] for req in spec.requires])
+        return [[spec.description, spec.name, values[spec.name]] for spec in self.outputs]
+
+def compile_plan(outputs, intermediates = ()):
+    '''turn a list of output specs into a SummaryPlan.
+
+    outputs       : specs written to the summary, in the order they should appear
+    intermediates : specs outputs may depend on. later entries replace earlier ones of the same
+                    name, so an experiment can override a shared intermediate.
+
+    raises KeyError if a spec needs something that is neither an input nor a spec, and
+    ValueError on circular requirements, so mistakes show up when the script is imported
+    rather than halfway through a batch.'''
+    library = {spec.name:spec for spec in intermediates}
+    library.update({spec.name:spec for spec in outputs})
+
+    steps = []
+    state = {}
+    def visit(name, needed_by):
+        if name in plan_inputs or state.get(name) == 'done':
+            return
+        if name not in library:
+            raise KeyError(f'"{needed_by}" requires "{name}", which is not an input or a known spec')
+        if state.get(name) == 'visiting':
+            raise ValueError(f'circular requirement between "{name}" and "{needed_by}"')
+        state[name] = 'visiting'
+        for req in library[name].requires:
+            visit(req, name)
+        state[name] = 'done'
+        steps.append(library[name])
+
+    for spec in outputs:
+        visit(spec.name, spec.name)
+
+    return SummaryPlan(list(outputs), steps)
+
+def event_count(name, event, description = None):
+    '''spec counting how many times event occurred in the session'''
+    return MetricSpec(name, lambda index: index.count(event), description)
+
+def proportion(num, den):
+    '''num / den, or NaN when there is nothing to divide by'''
+    return np.nan if not den else num / den
+
+########## shared by every experiment ##########
+
+GENERAL_INFO = [
+    MetricSpec('animal_ID', lambda head: str(head['vole']), 'animal ID'),
+    MetricSpec('day', lambda head: str(head['day']), 'experiment day entered by experimenter'),
+    MetricSpec('experiment', lambda head: head['experiment'], 'experiment script name'),
+    MetricSpec('date', lambda head: head['run_time'], 'time of run'),
+]
+
+########## door shape / door test ##########
+
+#door_opportunities is the number of rounds on which each door's lever was available. It
+#differs between experiments, so each script has to add its own.
+DOOR_INTERMEDIATES = [
+    MetricSpec('total_rounds', lambda index: index.max_round),
+    event_count('d1_presses', oes.door1_leverpress_prod),
+    event_count('d2_presses', oes.door2_leverpress_prod),
+    event_count('d1_beambreaks', oes.beam_break_1),
+    event_count('d2_beambreaks', oes.beam_break_2),
+    event_count('d1_openings', oes.door1_open_start),
+    event_count('d2_openings', oes.door2_open_start),
+]
+
+_beam_desc = '(max 1/round) (proxy for crossing, but could also be doorway investigation)'
+
+DOOR_METRICS = {spec.name:spec for spec in [
+    MetricSpec('rounds', lambda total_rounds: total_rounds,
+               'number of rounds in experiment'),
+
+    ### lever presses ###
+    MetricSpec('total_lever_press', lambda d1_presses, d2_presses: d1_presses + d2_presses,
+               'total number of lever presses'),
+    MetricSpec('non_press_rounds', lambda total_rounds, total_lever_press: total_rounds - total_lever_press,
+               'rounds without a press'),
+    MetricSpec('prop_non_presses_by_rounds', lambda non_press_rounds, total_rounds: non_press_rounds / total_rounds,
+               'proportion of rounds without a lever press'),
+
+    MetricSpec('door_1_lever_press_count', lambda d1_presses: d1_presses,
+               'number of presses for door 1'),
+    MetricSpec('door_2_lever_press_count', lambda d2_presses: d2_presses,
+               'number of presses for door 2'),
+    MetricSpec('door_1_non_press_count', lambda door_opportunities, d1_presses: int(door_opportunities) - d1_presses,
+               'opportunities for door_1 where there was no press'),
+    MetricSpec('door_2_non_press_count', lambda door_opportunities, d2_presses: int(door_opportunities) - d2_presses,
+               'opportunities for door_2 where there was no press'),
+
+    MetricSpec('door_1_lever_press_round_proportion', lambda d1_presses, door_opportunities: d1_presses / door_opportunities,
+               'proportion of rounds on which door 1 was pressed'),
+    MetricSpec('door_2_lever_press_round_proportion', lambda d2_presses, door_opportunities: d2_presses / door_opportunities,
+               'proportion of rounds on which door 2 was pressed'),
+    MetricSpec('door_1_non_press_round_proportion', lambda door_1_non_press_count, door_opportunities: door_1_non_press_count / door_opportunities,
+               'proportion of rounds on which door 1 was not pressed'),
+    MetricSpec('door_2_non_press_round_proportion', lambda door_2_non_press_count, door_opportunities: door_2_non_press_count / door_opportunities,
+               'proportion of rounds on which door 2 was not pressed'),
+
+    MetricSpec('door_1_lever_press_total_press_proportion', lambda d1_presses, total_lever_press: proportion(d1_presses, total_lever_press),
+               'proportion of all presses that were for door_1'),
+    MetricSpec('door_2_lever_press_total_press_proportion', lambda d2_presses, total_lever_press: proportion(d2_presses, total_lever_press),
+               'proportion of all presses that were for door_2'),
+
+    MetricSpec('mean_door_1_lever_press_latency', lambda round_df: round_df.door_1_lever_press_latency.mean(),
+               'mean door_1 lever press latency (excludes NaN)'),
+    MetricSpec('mean_door_2_lever_press_latency', lambda round_df: round_df.door_2_lever_press_latency.mean(),
+               'mean door_2 lever press latency (excludes NaN)'),
+    MetricSpec('median_door_1_lever_press_latency', lambda round_df: round_df.door_1_lever_press_latency.median(),
+               'median door_1 lever press latency (excludes NaN)'),
+    MetricSpec('median_door_2_lever_press_latency', lambda round_df: round_df.door_2_lever_press_latency.median(),
+               'median door_2 lever press latency (excludes NaN)'),
+
+    ### beam breaks ###
+    MetricSpec('door_1_beam_breaks', lambda d1_beambreaks: d1_beambreaks,
+               f'number of door 1 beam breaks {_beam_desc}'),
+    MetricSpec('door_2_beam_breaks', lambda d2_beambreaks: d2_beambreaks,
+               f'number of door 2 beam breaks {_beam_desc}'),
+
+    MetricSpec('prop_d1_beambreak_by_open', lambda d1_beambreaks, d1_openings: proportion(d1_beambreaks, d1_openings),
+               'proportion of door_1 opening on which the beam was subsequently broken'),
+    MetricSpec('prop_d2_beambreak_by_open', lambda d2_beambreaks, d2_openings: proportion(d2_beambreaks, d2_openings),
+               'proportion of door_2 opening on which the beam was subsequently broken'),
+    MetricSpec('prop_d1_beambreak_by_press', lambda d1_beambreaks, d1_presses: proportion(d1_beambreaks, d1_presses),
+               'proportion of door_1 lever presses on which the beam was subsequently broken'),
+    MetricSpec('prop_d2_beambreak_by_press', lambda d2_beambreaks, d2_presses: proportion(d2_beambreaks, d2_presses),
+               'proportion of door_2 lever presses on which the beam was subsequently broken'),
+
+    MetricSpec('mean_door_1_beam_break_latency', lambda round_df: round_df.latency_beam_break_door1.mean(),
+               f'mean door_1 beambreak latency {_beam_desc}'),
+    MetricSpec('mean_door_2_beam_break_latency', lambda round_df: round_df.latency_beam_break_door2.mean(),
+               f'mean door_2 beambreak latency {_beam_desc}'),
+    MetricSpec('median_door_1_beam_break_latency', lambda round_df: round_df.latency_beam_break_door1.median(),
+               f'median door_1 beambreak latency {_beam_desc}'),
+    MetricSpec('median_door_2_beam_break_latency', lambda round_df: round_df.latency_beam_break_door2.median(),
+               f'median door_2 beambreak latency {_beam_desc}'),
+]}
+
+#the summary of door_shape and door_test after the press counts, in output order
+DOOR_SUMMARY_TAIL = [DOOR_METRICS[name] for name in (
+    'door_1_lever_press_total_press_proportion',
+    'door_2_lever_press_total_press_proportion',
+    'mean_door_1_lever_press_latency',
+    'mean_door_2_lever_press_latency',
+    'median_door_1_lever_press_latency',
+    'median_door_2_lever_press_latency',
+    'door_1_beam_breaks',
+    'door_2_beam_breaks',
+    'prop_d1_beambreak_by_open',
+    'prop_d2_beambreak_by_open',
+    'prop_d1_beambreak_by_press',
+    'prop_d2_beambreak_by_press',
+    'mean_door_1_beam_break_latency',
+    'mean_door_2_beam_break_latency',
+    'median_door_1_beam_break_latency',
+    'median_door_2_beam_break_latency',
+)] + GENERAL_INFO
@@ -0,0 +1,232 @@
+'''command line entry point for the daily pipeline. run from this folder with
+
+    python -m operant_cli analyze /home/pi/sessions --manifest /home/pi/sessions/manifest.json
+    python -m operant_cli ingest cohort_3 /home/pi/sessions
+    python -m operant_cli report cohort_3 --experiment Door_test --metric total_lever_press
+    python -m operant_cli bench /home/pi/sessions/some_session.csv
+    python -m operant_cli watch /home/pi/sessions cohort_3
+
+Only argparse is imported up front. Each subcommand imports what it needs when it runs, so
+analyzing a session never pays for matplotlib, and `--help` starts instantly.'''
+import argparse
+import os
+import sys
+import time
+
+def _expand(paths, keep):
+    '''files in paths, with every directory replaced by the files under it that keep() accepts'''
+    import analysis_functions as af
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(f for f in af.csv_files(path) if keep(f))
+        else:
+            files += [path]
+    return files
+
+def _is_output(f):
+    return f.endswith(('_summary.csv', '_analysis_by_round.csv'))
+
+def _is_session(f):
+    return f.endswith('.csv') and not _is_output(f)
+
+def analyze(args):
+    import analyze as ana
+
+    if len(args.paths) == 1 and os.path.isdir(args.paths[0]):
+        results = ana.analyze_directory(args.paths[0],
+                                        n_workers = args.workers,
+                                        custom_script = args.custom_script,
+                                        output_loc = args.output_loc,
+                                        manifest_path = args.manifest,
+                                        summary_store = args.store,
+                                        cache = args.cache)
+    else:
+        results = ana.run_analysis_batch(_expand(args.paths, _is_session),
+                                         n_workers = args.workers,
+                                         custom_script = args.custom_script,
+                                         output_loc = args.output_loc,
+                                         summary_store = args.store,
+                                         cache = args.cache)
+
+    for _, res in results.loc[results.status != 'ok'].iterrows():
+        print(f'\nfailed: {res.file}\n{res.error}')
+    print(f'{(results.status == "ok").sum()} of {len(results)} sessions analyzed')
+    return 0 if (results.status == 'ok').all() else 1
+
+def _open_dataset(path, name = None):
+    import longi_class as lc
+    if os.path.exists(path):
+        return lc.LongitudinalAnalysis('').open(path)
+    return lc.LongitudinalAnalysis(name if name else os.path.basename(path.rstrip('/')))
+
+def ingest(args):
+    dataset = _open_dataset(args.dataset, args.name)
+    report = dataset.add_files(_expand(args.paths, _is_output),
+                               n_workers = args.workers,
+                               processes = args.processes)
+
+    for _, row in report.loc[report.status == 'error'].iterrows():
+        print(f'\ncould not read {row.file}\n{row.error}')
+    duplicates = report.loc[report.status == 'duplicate', 'file']
+    if len(duplicates):
+        print(f'{len(duplicates)} file(s) had values that were already in the dataset, those were skipped')
+
+    dataset.save(args.dataset)
+    print(f'{(report.status == "ok").sum()} of {len(report)} files added to {args.dataset}')
+    return 0 if (report.status != 'error').all() else 1
+
+def report(args):
+    if not os.path.exists(args.dataset):
+        print(f'{args.dataset} does not exist')
+        return 1
+    dataset = _open_dataset(args.dataset)
+
+    if not args.metric:
+        print(f'{dataset.experiment_name}: {len(dataset.files)} files')
+        print(f'experiments: {", ".join(dataset.experiments)}')
+        print(f'metrics ({len(dataset.metrics)}):')
+        for name in sorted(dataset.metrics):
+            print(f'    {name}')
+        return 0
+
+    import pandas as pd
+    import longitudinal_functions as lf
+
+    experiment = args.experiment if args.experiment else dataset.experiments[0]
+    out = lf.get_data(args.metric, experiment, dataset)
+    if out is None:
+        return 1
+    animals, days, values = out
+    table = pd.DataFrame(values, index = pd.Index(animals, name = 'animal'),
+                         columns = pd.Index(days, name = 'day'))
+    print(f'{args.metric} ({experiment})')
+    print(table.to_string())
+
+    if args.csv:
+        table.to_csv(args.csv)
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import plotting_functions as pf
+
+        fig, ax = plt.subplots(figsize = (max(4, len(days)), max(3, len(animals) / 2)))
+        finite = values[~pd.isna(values)]
+        pf.make_heatmap(values, animals, days, ax = ax, title = f'{args.metric} ({experiment})',
+                        cbarlabel = args.metric,
+                        val_floor = finite.min() if finite.size else 0,
+                        val_ceil = finite.max() if finite.size else 1)
+        fig.tight_layout()
+        fig.savefig(args.plot)
+    return 0
+
+def bench(args):
+    import tempfile
+    import analyze as ana
+    import analysis_script_lookup as asl
+
+    files = _expand(args.paths, _is_session)
+    with tempfile.TemporaryDirectory() as output_loc:
+        for f in files:
+            best = {}
+            for _ in range(args.repeat):
+                times = {}
+                start = time.perf_counter()
+                head, fname_sum, fname_by_round, df = ana.load_session(f, output_override_loc = output_loc)
+                times['load'] = time.perf_counter() - start
+
+                module = asl.script_lookup(head['experiment'])
+                start = time.perf_counter()
+                module.run_analysis(data_raw = df, head = head, by_round_fname = fname_by_round,
+                                    summary_fname = fname_sum)
+                times['analysis'] = time.perf_counter() - start
+
+                best = {k:min(v, best.get(k, v)) for k, v in times.items()}
+            print(f'{os.path.basename(f)}: {len(df)} events, ' +
+                  ', '.join(f'{k} {v * 1000:.1f} ms' for k, v in best.items()))
+    return 0
+
+def watch(args):
+    import session_watcher as sw
+    watcher = sw.SessionWatcher(args.watch_dir, args.dataset,
+                                experiment_name = args.name,
+                                manifest_path = args.manifest,
+                                poll_interval = args.interval,
+                                quiet_period = args.quiet_period,
+                                n_workers = args.workers,
+                                custom_script = args.custom_script,
+                                output_loc = args.output_loc,
+                                summary_store = args.store)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def parser():
+    p = argparse.ArgumentParser(prog = 'python -m operant_cli', description = 'operant session analysis')
+    sub = p.add_subparsers(dest = 'command', required = True)
+
+    a = sub.add_parser('analyze', help = 'analyze raw session csvs, writing their summary and by round csvs')
+    a.add_argument('paths', nargs = '+', help = 'session csvs, or directories of them')
+    a.add_argument('--workers', type = int, default = None, help = 'parallel workers (default: one per core)')
+    a.add_argument('--output-loc', default = None, help = 'directory to write the outputs to')
+    a.add_argument('--custom-script', default = None, help = 'analyze with this .py file instead')
+    a.add_argument('--manifest', default = None, help = 'only analyze new or changed sessions (a single directory only)')
+    a.add_argument('--cache', default = None, help = 'result cache directory')
+    a.add_argument('--store', default = None, help = 'summary store directory to add summaries to')
+    a.set_defaults(func = analyze)
+
+    i = sub.add_parser('ingest', help = 'add summary and by round csvs to a saved LongitudinalAnalysis')
+    i.add_argument('dataset', help = 'saved dataset, created if it does not exist')
+    i.add_argument('paths', nargs = '+', help = 'output csvs, or directories of them')
+    i.add_argument('--name', default = None, help = 'experiment name for a new dataset')
+    i.add_argument('--workers', type = int, default = None)
+    i.add_argument('--processes', action = 'store_true', help = 'parse in processes rather than threads')
+    i.set_defaults(func = ingest)
+
+    r = sub.add_parser('report', help = 'describe a dataset, or print a metric as an animal x day table')
+    r.add_argument('dataset')
+    r.add_argument('--metric', default = None)
+    r.add_argument('--experiment', default = None, help = 'default: the first experiment in the dataset')
+    r.add_argument('--csv', default = None, help = 'also save the table here')
+    r.add_argument('--plot', default = None, help = 'also save a heatmap here')
+    r.set_defaults(func = report)
+
+    b = sub.add_parser('bench', help = 'time loading and analyzing sessions (outputs go to a temp dir)')
+    b.add_argument('paths', nargs = '+', help = 'session csvs, or directories of them')
+    b.add_argument('--repeat', type = int, default = 3, help = 'report the best of this many runs')
+    b.set_defaults(func = bench)
+
+    w = sub.add_parser('watch', help = 'analyze sessions as they arrive, see session_watcher')
+    w.add_argument('watch_dir')
+    w.add_argument('dataset', help = 'saved dataset to add the outputs to')
+    w.add_argument('--name', default = None, help = 'experiment name for a new dataset')
+    w.add_argument('--manifest', default = None)
+    w.add_argument('--interval', type = float, default = 30, help = 'seconds between polls')
+    w.add_argument('--quiet-period', type = float, default = 600,
+                   help = 'seconds without changes after which a session counts as finished')
+    w.add_argument('--workers', type = int, default = None)
+    w.add_argument('--custom-script', default = None)
+    w.add_argument('--output-loc', default = None)
+    w.add_argument('--store', default = None)
+    w.set_defaults(func = watch)
+    return p
+
+#arguments that are paths, made absolute before any subcommand runs
+path_args = ('paths', 'dataset', 'watch_dir', 'output_loc', 'custom_script', 'manifest',
+             'cache', 'store', 'csv', 'plot')
+
+def main(argv = None):
+    args = parser().parse_args(argv)
+    for name in path_args:
+        value = getattr(args, name, None)
+        if isinstance(value, list):
+            setattr(args, name, [os.path.abspath(v) for v in value])
+        elif value:
+            setattr(args, name, os.path.abspath(value))
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+'''on-disk cache of per session results, shared by the analysis scripts and the notebooks.
+
+Entries are keyed by the content hash of the raw session file, plus the version of the
+analysis module for analysis outputs (see analysis_manifest.module_version), so an entry can
+never be stale: editing either the session or the script simply changes the key. Two kinds
+of entry are kept per session:
+
+    events  : the header and parsed event table returned by analyze.load_session
+    outputs : the (round_df, summary_df) returned by the session's analysis script
+
+Both keys include a hash of the source that produced the entry (analyze and the local
+modules it uses, such as analysis_functions and lookup_classes, and for outputs also the
+analysis module and its helpers), so changing any of it invalidates the affected entries.
+
+Every entry is its own pickle under cache_dir, written atomically, so any number of
+processes can share one cache. Reading an entry bumps its mtime, and once the cache is
+bigger than max_bytes the least recently used entries are deleted. Entries that cant be
+unpickled are deleted and treated as missing.
+
+The size of the cache is kept in a small index file next to the entries, so a put only reads 
+and rewrites that file; the entries themselves are only walked by evict(). Processes writing 
+at the same moment can lose each other's update of the index, so the entries are recounted 
+every rescan_every puts, and by any evict().
+
+A handle pickled to another process (eg. passed to a process pool) arrives as that process's 
+shared handle for the same directory, see shared().
+
+    cache = ResultCache('~/.cache/operant')
+    head, _, _, df = analyze.load_session(filepath, cache = cache)
+'''
+import os
+import hashlib
+
+import pandas as pd
+
+import analysis_manifest as am
+
+#the size index is checked against the entries on disk every this many puts of a handle
+rescan_every = 1000
+
+#file in cache_dir holding the size of the cache in bytes
+index_name = 'size'
+
+#{(cache_dir, max_bytes) : ResultCache}, the handles opened with shared() in this process
+_shared = {}
+
+_parsing_version = None
+
+def parsing_version():
+    '''hash of the code that turns a raw session into its header and event table'''
+    global _parsing_version
+    if _parsing_version is None:
+        import analyze
+        _parsing_version = am.source_version(analyze)
+    return _parsing_version
+
+def shared(cache_dir, max_bytes = 2 * 1024**3):
+    '''the ResultCache of cache_dir for this process, opened on first use and reused after, 
+    so every session analyzed in the process shares its file hashes and module versions'''
+    key = (os.path.abspath(os.path.expanduser(cache_dir)), max_bytes)
+    if key not in _shared:
+        _shared[key] = ResultCache(*key)
+    return _shared[key]
+
+class ResultCache:
+
+    def __init__(self, cache_dir, max_bytes = 2 * 1024**3):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok = True)
+        #{filepath: (size, mtime, hash)}, so a file is only hashed again once it changes
+        self._hashes = {}
+        #{module file: version}
+        self._versions = {}
+        self._puts = 0
+
+    def __reduce__(self):
+        return (shared, (self.cache_dir, self.max_bytes))
+
+    def source_hash(self, filepath):
+        st = os.stat(filepath)
+        known = self._hashes.get(filepath)
+        if known is None or known[:2] != (st.st_size, st.st_mtime):
+            known = (st.st_size, st.st_mtime, am.file_hash(filepath))
+            self._hashes[filepath] = known
+        return known[2]
+
+    def key(self, filepath, version):
+        '''cache key of filepath's results made by version (a module version or format string)'''
+        return hashlib.sha256(f'{self.source_hash(filepath)}|{version}'.encode()).hexdigest()
+
+    def events_key(self, filepath):
+        return self.key(filepath, f'events {parsing_version()}')
+
+    def outputs_key(self, filepath, module):
+        '''key of the outputs of the analysis module (an experiment's or a custom script) for filepath'''
+        if module.__file__ not in self._versions:
+            self._versions[module.__file__] = am.module_version(module)
+        return self.key(filepath, f'outputs {parsing_version()} {self._versions[module.__file__]}')
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def get(self, key):
+        '''the cached object, or None if there isnt one'''
+        path = self._path(key)
+        try:
+            obj = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            #truncated or written by incompatible code, drop it and recompute
+            self._remove(path)
+            return None
+        try:
+            #mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return obj
+
+    def put(self, key, obj):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        #unique per process, so concurrent writers of the same entry dont clash
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        pd.to_pickle(obj, tmp_path)
+        #read before the entry is in place, so a first count of the entries doesnt include it
+        size = self.size()
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        self._puts += 1
+        size += os.path.getsize(path) - replaced
+        if size > self.max_bytes or self._puts % rescan_every == 0:
+            self.evict()
+        else:
+            self._write_size(size)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, index_name)
+
+    def size(self):
+        '''bytes in the cache, as recorded in the index. The entries are counted if there is no index yet'''
+        try:
+            with open(self._index_path()) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            size = sum(size for _, size, _ in self.entries())
+            self._write_size(size)
+            return size
+
+    def _write_size(self, size):
+        tmp_path = f'{self._index_path()}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(size))
+        os.replace(tmp_path, self._index_path())
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            #evicted by another process
+            pass
+
+    def entries(self):
+        '''[(path, size, mtime), ...] of every entry in the cache'''
+        out = []
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                if not f.endswith('.pkl'):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    #evicted by another process
+                    continue
+                out += [(path, st.st_size, st.st_mtime)]
+        return out
+
+    def evict(self):
+        '''delete the least recently used entries until the cache fits in max_bytes'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key = lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        self._write_size(total)
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            self._remove(path)
+        self._write_size(0)
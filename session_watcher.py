@@ -0,0 +1,148 @@
+'''watch the folder the rigs copy sessions into and analyze each session soon after it ends.
+
+The folder is polled every poll_interval seconds. A raw session csv is analyzed once it has
+stopped changing between two polls and either its header says it is finished (done:True, or
+an experiment_status like "complete") or it has not changed for quiet_period seconds, for
+sessions that ended without updating their header. Sessions are analyzed with
+analyze.run_analysis_batch, remembered in an analysis_manifest so nothing is analyzed twice,
+and their outputs are added to a LongitudinalAnalysis saved at dataset_path.
+
+    watcher = SessionWatcher('/data/incoming', '/data/cohort_3', experiment_name = 'cohort 3')
+    watcher.run()
+'''
+import os
+import time
+import traceback
+
+import pandas as pd
+
+import analysis_functions as af
+import analysis_manifest as am
+import analyze
+import longi_class as lc
+
+#experiment_status values that mean the session is over
+finished_statuses = ('complete', 'completed', 'done', 'finished')
+
+def session_finished(filepath):
+    '''True if the header of a raw session says the session is over'''
+    try:
+        head = af.get_header(filepath)
+    except Exception:
+        #header not written yet
+        return False
+    status = head.get('experiment_status')
+    return head.get('done') is True or (isinstance(status, str) and status.lower() in finished_statuses)
+
+class SessionWatcher:
+    '''polls watch_dir for finished sessions, see the module docstring.
+
+    dataset_path    : where the LongitudinalAnalysis is kept. Opened if it exists, created
+                      (named experiment_name) if it doesnt.
+    manifest_path   : analysis manifest, by default .analysis_manifest.json in watch_dir
+    poll_interval   : seconds between polls
+    quiet_period    : seconds a session must be unchanged before it counts as finished when
+                      its header doesnt say so
+    n_workers, custom_script, output_loc, summary_store : passed to analyze.run_analysis_batch'''
+
+    def __init__(self, watch_dir, dataset_path, experiment_name = None, manifest_path = None,
+                 poll_interval = 30, quiet_period = 600, n_workers = None, custom_script = None,
+                 output_loc = None, summary_store = None):
+        #absolute, so nothing depends on the working directory while we run
+        absolute = lambda path: os.path.abspath(path) if path else path
+        self.watch_dir = absolute(watch_dir)
+        self.dataset_path = absolute(dataset_path)
+        self.experiment_name = experiment_name
+        self.manifest = am.AnalysisManifest(absolute(manifest_path) if manifest_path else
+                                            os.path.join(self.watch_dir, '.analysis_manifest.json'))
+        self.poll_interval = poll_interval
+        self.quiet_period = quiet_period
+        self.n_workers = n_workers
+        self.custom_script = absolute(custom_script)
+        self.output_loc = absolute(output_loc)
+        self.summary_store = absolute(summary_store)
+
+        #{filepath: (size, mtime, time it was first seen with that size and mtime)}
+        self._seen = {}
+        #files that failed analysis, not retried until they change
+        self._failed = {}
+
+    def open_dataset(self):
+        if os.path.exists(self.dataset_path):
+            return lc.LongitudinalAnalysis('').open(self.dataset_path)
+        return lc.LongitudinalAnalysis(self.experiment_name)
+
+    def ready_sessions(self, now = None):
+        '''raw sessions under watch_dir that are finished and still need analysis'''
+        now = now if now is not None else time.time()
+        ready = []
+        current = {}
+        for f in analyze.raw_session_files(self.watch_dir):
+            try:
+                st = os.stat(f)
+            except FileNotFoundError:
+                continue
+
+            size_mtime = (st.st_size, st.st_mtime)
+            seen = self._seen.get(f)
+            since = seen[2] if seen and seen[:2] == size_mtime else now
+            current[f] = size_mtime + (since,)
+
+            if since == now or self._failed.get(f) == size_mtime:
+                #still being written (or changed since the last poll), or already failed as is
+                continue
+            if not (session_finished(f) or now - since >= self.quiet_period):
+                continue
+            if self.manifest.needs_analysis(f, outputs = analyze.output_names(f, self.output_loc),
+                                            custom_script = self.custom_script):
+                ready += [f]
+
+        self._seen = current
+        return ready
+
+    def poll_once(self):
+        '''analyze every session that became ready since the last poll and add its outputs to
+        the dataset. returns the analyze.run_analysis_batch results (empty if nothing was ready)'''
+        ready = self.ready_sessions()
+        if not ready:
+            return pd.DataFrame(columns = ['file', 'experiment', 'status', 'error', 'seconds'])
+
+        print(f'analyzing {len(ready)} new session(s)')
+        results = analyze.run_analysis_batch(ready,
+                                             n_workers = self.n_workers,
+                                             custom_script = self.custom_script,
+                                             output_loc = self.output_loc,
+                                             summary_store = self.summary_store)
+
+        outputs = []
+        for _, res in results.iterrows():
+            if res.status == 'ok':
+                self.manifest.record(res.file, custom_script = self.custom_script)
+                outputs += list(analyze.output_names(res.file, self.output_loc))
+            else:
+                print(f'analysis of {res.file} failed:\n{res.error}')
+                self._failed[res.file] = self._seen[res.file][:2]
+        self.manifest.save()
+
+        if outputs:
+            dataset = self.open_dataset()
+            report = dataset.add_files(outputs, n_workers = self.n_workers)
+            for _, row in report.loc[report.status != 'ok'].iterrows():
+                print(f'{row.file} was not fully added ({row.status}):\n{row.error if row.error else ""}')
+            dataset.save(self.dataset_path)
+        return results
+
+    def run(self, max_polls = None):
+        '''poll until interrupted (or max_polls polls have been made)'''
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            try:
+                self.poll_once()
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                #keep watching, the next poll may well work
+                traceback.print_exc()
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(self.poll_interval)
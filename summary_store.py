@@ -0,0 +1,92 @@
+'''optional columnar store for session summaries, kept alongside the legacy summary csvs.
+
+Every session's summary is written as one long table (one row per var_name) to a Parquet file
+partitioned by experiment and animal:
+
+    store_dir/experiment=Door_test/animal=3558/<session>_summary.parquet
+
+so a whole cohort can be loaded with a single read_summaries call that only reads the columns
+and partitions asked for. Needs pyarrow.'''
+import os
+
+import pandas as pd
+import numpy as np
+
+import longitudinal_functions as lf
+
+#columns written to each session file. experiment and animal come from the partition folders
+store_columns = ['day', 'var_name', 'var_desc', 'value', 'text', 'date', 'file']
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('the summary store needs pyarrow. install it with "pip install pyarrow"') from None
+
+def summary_rows(head, summary_df, file = None):
+    '''long table of one session's summary. summary_df is the transposed
+    (var_desc, var_name, var) frame written by the analysis scripts. Numeric values go in
+    the float column "value", anything else in the string column "text".'''
+    rows = summary_df.transpose() if 'var_name' in summary_df.index else summary_df
+    var = rows['var']
+    value = pd.to_numeric(var, errors = 'coerce').astype(float)
+
+    return pd.DataFrame({'day':int(float(head['day'])),
+                         'var_name':rows['var_name'].astype(str).to_numpy(),
+                         'var_desc':rows['var_desc'].astype(str).to_numpy(),
+                         'value':value.to_numpy(),
+                         'text':var.astype(str).where(value.isna(), None).to_numpy(),
+                         'date':str(head.get('run_time')),
+                         'file':file},
+                        columns = store_columns)
+
+def session_path(store_dir, head, summary_fname):
+    '''where a session's summary lives in the store'''
+    animal = int(float(head['vole']))
+    session = os.path.splitext(os.path.basename(summary_fname))[0]
+    return os.path.join(store_dir, f'experiment={head["experiment"]}', f'animal={animal}',
+                        f'{session}.parquet')
+
+def append_summary(store_dir, head, summary_df, summary_fname):
+    '''add (or replace, if it was analyzed before) one session's summary in the store'''
+    _require_pyarrow()
+    path = session_path(store_dir, head, summary_fname)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    #hidden while it is being written, so a concurrent read_summaries never picks it up
+    tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    summary_rows(head, summary_df, file = summary_fname).to_parquet(tmp_path, index = False)
+    os.replace(tmp_path, path)
+    return path
+
+def add_summary_csvs(store_dir, summary_files):
+    '''backfill the store from summary csvs that were written before it existed'''
+    for f in summary_files:
+        head, df = lf.read_summary_csv(f)
+        append_summary(store_dir, head, df, f)
+
+def read_summaries(store_dir, columns = None, experiment = None, animals = None, var_names = None):
+    '''load summaries from the store in one read.
+
+    columns    : only read these columns (animal and experiment are always available)
+    experiment : only read this experiment (or list of experiments)
+    animals    : only read these animals
+    var_names  : only keep these metrics
+
+    returns a long DataFrame with animal, experiment and the store_columns'''
+    _require_pyarrow()
+    if columns is not None:
+        columns = list(columns) + [col for col in ('experiment', 'animal') if col not in columns]
+    filters = []
+    if experiment is not None:
+        filters += [('experiment', 'in', [experiment] if isinstance(experiment, str) else list(experiment))]
+    if animals is not None:
+        filters += [('animal', 'in', [int(a) for a in np.atleast_1d(animals)])]
+    if var_names is not None:
+        filters += [('var_name', 'in', list(var_names))]
+
+    df = pd.read_parquet(store_dir, columns = columns, filters = filters if filters else None)
+    for col in ('experiment', 'animal'):
+        if col in df.columns:
+            df[col] = df[col].astype(str if col == 'experiment' else int)
+    return df